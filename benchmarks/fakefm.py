@@ -0,0 +1,360 @@
+"""
+A local stand-in for Last.fm, used to benchmark the cog without touching the real service.
+
+It answers the api methods the cog uses, serves library html with the markup the scrapers
+look for and serves generated cover images. Latency and errors can be injected to see how
+the client behaves when Last.fm is slow or having issues.
+"""
+
+import asyncio
+import hashlib
+import random
+from collections import Counter
+from html import escape
+from io import BytesIO
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from PIL import Image
+
+ARTIST_POOL = 2000
+
+
+def _rng(*seed):
+    return random.Random(hashlib.md5("|".join(map(str, seed)).encode()).hexdigest())
+
+
+class FakeLastFM:
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, server_error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.requests = Counter()
+        self.server = None
+        self._images = {}
+
+    @property
+    def url(self):
+        return str(self.server.make_url("")).rstrip("/")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/2.0/", self.handle_api)
+        app.router.add_post("/2.0/", self.handle_api)
+        app.router.add_get("/img/{key}.png", self.handle_image)
+        app.router.add_get("/user/{user}/library/artists", self.handle_library_artists)
+        app.router.add_get("/user/{user}/library/music/{artist}", self.handle_library_artist)
+        app.router.add_get(
+            "/user/{user}/library/music/{artist}/{kind:\\+tracks|\\+albums}",
+            self.handle_library_artist_top,
+        )
+        app.router.add_get(
+            "/user/{user}/library/music/{artist}/_/{track}", self.handle_library_item
+        )
+        app.router.add_get("/user/{user}/library/music/{artist}/{album}", self.handle_library_item)
+        app.router.add_get("/music/{artist}/+images", self.handle_artist_images)
+        app.router.add_get("/music/{artist}", self.handle_artist_page)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    async def close(self):
+        await self.server.close()
+
+    def reset_counters(self):
+        self.requests.clear()
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def _server_error(self):
+        return random.random() < self.server_error_rate
+
+    # synthetic data
+
+    def image_url(self, key):
+        return f"{self.url}/img/{key}.png"
+
+    def images(self, key):
+        url = self.image_url(key)
+        return [{"#text": url, "size": s} for s in ("small", "medium", "large", "extralarge")]
+
+    def top(self, username, kind, limit):
+        rng = _rng(username, kind)
+        picks = rng.sample(range(ARTIST_POOL), min(limit, ARTIST_POOL))
+        counts = sorted((rng.randint(1, 3000) for _ in picks), reverse=True)
+        return list(zip(picks, counts))
+
+    def playcount(self, username, *entity):
+        rng = _rng(username, *entity)
+        return rng.randint(0, 500) if rng.random() < 0.7 else 0
+
+    # api
+
+    async def handle_api(self, request):
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+        method = params.get("method", "").lower()
+        self.requests[f"api:{method}"] += 1
+        await self._delay()
+        if self._server_error():
+            return web.Response(status=503, text="Service Unavailable")
+        if random.random() < self.error_rate:
+            return web.json_response({"error": 29, "message": "Rate Limit Exceeded"})
+        handler = getattr(self, "api_" + method.replace(".", "_"), None)
+        if handler is None:
+            return web.json_response({"error": 3, "message": "Invalid Method"}, status=400)
+        return web.json_response(handler(params))
+
+    def _top_payload(self, params, kind, make):
+        user = params["user"]
+        limit = int(params.get("limit", 50))
+        items = [make(i, plays) for i, plays in self.top(user, kind, limit)]
+        return {
+            f"top{kind}s": {
+                "@attr": {"user": user, "total": str(len(items)), "page": "1"},
+                kind: items,
+            }
+        }
+
+    def api_user_gettopartists(self, params):
+        return self._top_payload(
+            params,
+            "artist",
+            lambda i, plays: {
+                "name": f"Artist {i}",
+                "playcount": str(plays),
+                "url": f"{self.url}/music/Artist+{i}",
+                "image": self.images(f"artist-{i}"),
+            },
+        )
+
+    def api_user_gettopalbums(self, params):
+        return self._top_payload(
+            params,
+            "album",
+            lambda i, plays: {
+                "name": f"Album {i}",
+                "playcount": str(plays),
+                "artist": {"name": f"Artist {i % 500}"},
+                "image": self.images(f"album-{i}"),
+            },
+        )
+
+    def api_user_gettoptracks(self, params):
+        return self._top_payload(
+            params,
+            "track",
+            lambda i, plays: {
+                "name": f"Track {i}",
+                "playcount": str(plays),
+                "artist": {"name": f"Artist {i % 500}"},
+                "image": self.images(f"track-{i}"),
+            },
+        )
+
+    def api_user_getrecenttracks(self, params):
+        user = params["user"]
+        limit = int(params.get("limit", 50))
+        page = int(params.get("page", 1))
+        total = 1200
+        rng = _rng(user, "recent", page)
+        now = 1_700_000_000
+        tracks = []
+        for n in range((page - 1) * limit, min(page * limit, total)):
+            i = rng.randrange(ARTIST_POOL)
+            tracks.append(
+                {
+                    "name": f"Track {i}",
+                    "artist": {"#text": f"Artist {i % 500}"},
+                    "album": {"#text": f"Album {i}"},
+                    "image": self.images(f"album-{i}"),
+                    "url": f"{self.url}/music/Artist+{i % 500}/_/Track+{i}",
+                    "date": {"uts": str(now - n * 200)},
+                }
+            )
+        return {
+            "recenttracks": {
+                "@attr": {
+                    "user": user,
+                    "page": str(page),
+                    "perPage": str(limit),
+                    "totalPages": str(-(-total // limit)),
+                    "total": str(total),
+                },
+                "track": tracks,
+            }
+        }
+
+    def api_artist_getinfo(self, params):
+        artist = params["artist"]
+        info = {
+            "name": artist,
+            "url": f"{self.url}/music/{artist}",
+            "image": self.images(f"artist-{artist}"),
+            "stats": {"listeners": "12345", "playcount": "678910"},
+            "similar": {"artist": [{"name": f"Similar {n}"} for n in range(5)]},
+            "tags": {"tag": [{"name": f"tag {n}"} for n in range(5)]},
+        }
+        if "user" in params:
+            info["stats"]["userplaycount"] = str(self.playcount(params["user"], artist))
+        return {"artist": info}
+
+    def api_album_getinfo(self, params):
+        album, artist = params["album"], params["artist"]
+        info = {"name": album, "artist": artist, "image": self.images(f"album-{album}")}
+        if "user" in params:
+            info["userplaycount"] = str(self.playcount(params["user"], artist, album))
+        return {"album": info}
+
+    def api_track_getinfo(self, params):
+        track, artist = params["track"], params["artist"]
+        info = {
+            "name": track,
+            "artist": {"name": artist},
+            "album": {"image": self.images(f"track-{track}")},
+            "toptags": {"tag": [{"name": f"tag {n}"} for n in range(3)]},
+            "userloved": "0",
+        }
+        user = params.get("user") or params.get("username")
+        if user:
+            info["userplaycount"] = str(self.playcount(user, artist, track))
+        return {"track": info}
+
+    def api_user_getinfo(self, params):
+        user = params["user"]
+        return {
+            "user": {
+                "name": user,
+                "playcount": "1200",
+                "url": f"{self.url}/user/{user}",
+                "image": self.images(f"user-{user}"),
+                "registered": {"unixtime": "1500000000"},
+            }
+        }
+
+    # html
+
+    def _html(self, body):
+        return web.Response(
+            text=f"<!DOCTYPE html><html><head><title>Last.fm</title></head><body>{body}</body></html>",
+            content_type="text/html",
+        )
+
+    def _chartlist(self, rows):
+        items = "".join(
+            f'<tr class="chartlist-row">'
+            f'<td class="chartlist-image"><img src="{escape(image)}" alt=""></td>'
+            f'<td class="chartlist-name"><a href="#" title="{escape(name)}">{escape(name)}</a></td>'
+            f'<td class="chartlist-bar"><span class="chartlist-count-bar-value">'
+            f"{plays:,} scrobbles</span></td></tr>"
+            for name, plays, image in rows
+        )
+        return f'<table class="chartlist"><tbody data-playlisting-add-entries="">{items}</tbody></table>'
+
+    def _header(self, artist):
+        image = self.image_url(f"artist-{artist}").replace("/img/", "/img/avatar70s-")
+        return (
+            f'<header><span class="library-header-image"><img src="{image}"></span>'
+            f'<a class="library-header-crumb" href="#">{escape(artist)}</a>'
+            f'<h2 class="library-header-title">{escape(artist)}</h2></header>'
+        )
+
+    def _metadata(self, *values):
+        items = "".join(
+            f'<li><h4>Stat</h4><p class="metadata-display">{value:,}</p></li>' for value in values
+        )
+        return f'<ul class="metadata-list">{items}</ul>'
+
+    async def _html_request(self, kind):
+        self.requests[f"html:{kind}"] += 1
+        await self._delay()
+        return self._server_error()
+
+    async def handle_library_artists(self, request):
+        if await self._html_request("library_artists"):
+            raise web.HTTPServiceUnavailable()
+        user = request.match_info["user"]
+        page = int(request.query.get("page", 1))
+        top = self.top(user, "artist", 1000)[(page - 1) * 50 : page * 50]
+        rows = [
+            (f"Artist {i}", plays, self.image_url(f"avatar70s-artist-{i}")) for i, plays in top
+        ]
+        return self._html(self._chartlist(rows))
+
+    async def handle_library_artist(self, request):
+        if await self._html_request("library_artist"):
+            raise web.HTTPServiceUnavailable()
+        user, artist = request.match_info["user"], request.match_info["artist"]
+        plays = self.playcount(user, artist)
+        if not plays:
+            return self._html(self._header(artist))
+        rng = _rng(user, artist, "overview")
+        albums = [(f"{artist} Album {n}", rng.randint(1, 99), "") for n in range(5)]
+        tracks = [(f"{artist} Track {n}", rng.randint(1, 99), "") for n in range(5)]
+        return self._html(
+            self._header(artist)
+            + self._metadata(plays, len(albums), len(tracks))
+            + self._chartlist(albums)
+            + self._chartlist(tracks)
+            + self._chartlist([])
+        )
+
+    async def handle_library_artist_top(self, request):
+        if await self._html_request("library_artist_top"):
+            raise web.HTTPServiceUnavailable()
+        user, artist = request.match_info["user"], request.match_info["artist"]
+        kind = request.match_info["kind"][1:]
+        rng = _rng(user, artist, kind)
+        rows = [(f"{artist} {kind} {n}", rng.randint(1, 99), "") for n in range(50)]
+        return self._html(self._header(artist) + self._chartlist(rows))
+
+    async def handle_library_item(self, request):
+        if await self._html_request("library_item"):
+            raise web.HTTPServiceUnavailable()
+        info = request.match_info
+        plays = self.playcount(info["user"], info["artist"], info.get("track") or info["album"])
+        # pad the page out, real library pages are large
+        filler = "<div class='filler'>" + "x" * 50_000 + "</div>"
+        return self._html(self._header(info["artist"]) + self._metadata(plays) + filler)
+
+    async def handle_artist_images(self, request):
+        if await self._html_request("artist_images"):
+            raise web.HTTPServiceUnavailable()
+        artist = request.match_info["artist"]
+        image = self.image_url(f"artist-{artist}").replace("/img/", "/img/avatar170s-")
+        items = "".join(
+            f'<li class="image-list-item-wrapper"><a href="#"><img class="image-list-image" src="{image}"></a></li>'
+            for _ in range(20)
+        )
+        return self._html(f'<ul class="image-list">{items}</ul>')
+
+    async def handle_artist_page(self, request):
+        if await self._html_request("artist_page"):
+            raise web.HTTPServiceUnavailable()
+        similar = "".join(
+            f'<h3 class="artist-similar-artists-sidebar-item-name"><a href="#">Similar {n}</a></h3>'
+            for n in range(5)
+        )
+        listeners = '<li class="header-metadata-tnew-item--listeners"><abbr>12.3K</abbr></li>'
+        return self._html(similar + listeners)
+
+    # images
+
+    async def handle_image(self, request):
+        self.requests["image"] += 1
+        await self._delay()
+        if self._server_error():
+            raise web.HTTPServiceUnavailable()
+        key = request.match_info["key"]
+        data = self._images.get(key)
+        if data is None:
+            rng = _rng(key)
+            image = Image.new("RGB", (300, 300), tuple(rng.randrange(256) for _ in range(3)))
+            buffer = BytesIO()
+            image.save(buffer, "png")
+            data = self._images[key] = buffer.getvalue()
+        return web.Response(body=data, content_type="image/png")
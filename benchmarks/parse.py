@@ -0,0 +1,159 @@
+"""
+Correctness and speed regression suite for the scrapers, run on the pages in
+benchmarks/fixtures.
+
+The pages are synthetic stand-ins written around the markup the extractors look for,
+see fixtures/README.md. They catch the backends disagreeing and speed regressions, not
+changes to the real last.fm or musixmatch markup.
+
+Usage:
+    python -m benchmarks.parse [--repeat 200] [--save FILE] [--baseline FILE]
+
+Every extractor is run on its fixtures with each available backend and the records
+have to match fixtures/expected.json. Reported are the time and the peak of python
+allocations per page, tracemalloc doesn't see memory allocated inside libxml2.
+
+With --baseline the timings are compared to an earlier --save and cases slower than
+--tolerance times the baseline fail. --update rewrites expected.json after an intended
+change to the extractors or the fixtures.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lastfm.utils.extract import BACKENDS, PlaycountStream, lyrics_from_text  # noqa: E402
+
+FIXTURES = ROOT / "benchmarks" / "fixtures"
+EXPECTED = FIXTURES / "expected.json"
+
+# extractor method, fixture page
+CASES = [
+    ("library_overview", "library_artist.html"),
+    ("library_overview", "library_artist_never.html"),
+    ("library_top", "library_artist_tracks.html"),
+    ("library_top", "library_artist_albums.html"),
+    ("library_top", "library_artist_never.html"),
+    ("playcount", "library_track.html"),
+    ("playcount", "library_artist.html"),
+    ("playcount", "library_artist_never.html"),
+    ("playcount_stream", "library_track.html"),
+    ("playcount_stream", "library_artist.html"),
+    ("playcount_stream", "library_artist_never.html"),
+    ("chart_artists", "library_artists.html"),
+    ("artist_image", "artist_images.html"),
+    ("artist_image", "library_artist_never.html"),
+    ("similar_artists", "artist.html"),
+    ("lyrics_search", "musixmatch_search.html"),
+    ("lyrics_search", "musixmatch_search_empty.html"),
+    ("page_text", "musixmatch_song.html"),
+    ("lyrics", "musixmatch_song.html"),
+    ("lyrics", "musixmatch_search_empty.html"),
+]
+
+
+def playcount_stream(html, chunk_size=8192):
+    """Feed a page to the streaming extractor like fetch_until does."""
+    page = PlaycountStream()
+    for start in range(0, len(html), chunk_size):
+        page.feed(html[start : start + chunk_size])
+        if page.done:
+            break
+    return page.result
+
+
+def normalize(method, result):
+    if method == "page_text":
+        # whitespace between tags differs between parsers
+        result = " ".join(result.split())
+    # compare the way the records are stored, tuples and lists alike
+    return json.loads(json.dumps(result))
+
+
+def timeit(func, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html)
+    return (time.perf_counter() - start) / repeat
+
+
+def peak_memory(func, html):
+    tracemalloc.start()
+    func(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def run_case(backends, method, fixture, repeat):
+    html = (FIXTURES / fixture).read_text()
+    if method == "playcount_stream":
+        # the streaming extractor doesn't depend on the backend
+        funcs = {"stream": playcount_stream}
+    elif method == "lyrics":
+        # page text followed by the string handling scrape_lyrics does on it
+        funcs = {
+            name: lambda html, backend=backend: lyrics_from_text(backend.page_text(html))
+            for name, backend in backends.items()
+        }
+    else:
+        funcs = {name: getattr(backend, method) for name, backend in backends.items()}
+    return {
+        name: {
+            "result": normalize(method, func(html)),
+            "time": timeit(func, html, repeat),
+            "peak": peak_memory(func, html),
+        }
+        for name, func in funcs.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--save", type=Path, help="write the timings to this file")
+    parser.add_argument("--baseline", type=Path, help="compare timings with a saved run")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--update", action="store_true", help="rewrite expected.json")
+    args = parser.parse_args()
+
+    backends = {name: cls() for name, cls in BACKENDS.items()}
+    expected = {} if args.update else json.loads(EXPECTED.read_text())
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else {}
+    timings = {}
+    failed = False
+    for method, fixture in CASES:
+        case = f"{method} {fixture}"
+        results = run_case(backends, method, fixture, args.repeat)
+        if args.update:
+            expected[case] = next(iter(results.values()))["result"]
+        problems = []
+        for name, result in results.items():
+            key = f"{case} {name}"
+            timings[key] = result["time"]
+            if result["result"] != expected.get(case):
+                problems.append(f"{name} records differ")
+            if key in baseline and result["time"] > baseline[key] * args.tolerance:
+                problems.append(f"{name} x{result['time'] / baseline[key]:.1f} slower")
+        failed = failed or bool(problems)
+        line = " | ".join(
+            f"{name} {r['time'] * 1000:7.2f}ms {r['peak'] / 1024:7.0f}KiB"
+            for name, r in results.items()
+        )
+        print(f"{method:<17} {fixture:<30} | {line} | {'; '.join(problems) or 'ok'}")
+
+    if args.update:
+        EXPECTED.write_text(json.dumps(expected, indent=2, ensure_ascii=False) + "\n")
+    if args.save:
+        args.save.write_text(json.dumps(timings, indent=2) + "\n")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
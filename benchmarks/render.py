@@ -0,0 +1,152 @@
+"""
+Chart rendering benchmark, the in-memory compositing of lastfm.charts against the
+previous pipeline that round tripped every tile through PNG.
+
+Usage:
+    python -m benchmarks.render [--sizes 3 5 10] [--repeat 5]
+
+Covers are generated JPEGs like the ones the last.fm CDN serves. Both pipelines have
+to produce the same canvas, reported are the time per chart with and without the
+final WebP encode. "current" decodes every cover, "cached" renders from the decoded
+tiles the tile cache keeps. Charts over 7x7 used to be drawn at full size and scaled
+down after, they are now drawn at their final size so only the canvas size can be
+compared.
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageDraw
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lastfm.charts import (  # noqa: E402
+    TILE_SIZE,
+    album_caption,
+    chart_font,
+    chart_tile_size,
+    encode_chart,
+    make_tiles,
+    render_chart,
+)
+
+DATA = ROOT / "lastfm" / "data"
+
+
+def make_cover(seed, size=300):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        box = sorted(rng.randrange(size) for _ in range(2)) + sorted(
+            rng.randrange(size) for _ in range(2)
+        )
+        draw.rectangle(
+            (box[0], box[2], box[1], box[3]), fill=tuple(rng.randrange(256) for _ in range(3))
+        )
+    file = BytesIO()
+    image.save(file, "jpeg", quality=90)
+    return file.getvalue()
+
+
+def make_chart(w, h):
+    return [
+        (f"{1000 - i} plays\nAlbum number {i} — Some Artist With A Long Name", make_cover(i))
+        for i in range(w * h)
+    ]
+
+
+def current_render(data, w, h, loc):
+    texts, covers = zip(*data)
+    tiles = make_tiles(covers, chart_tile_size(w, h))
+    return render_chart(list(zip(texts, tiles)), w, h, loc, album_caption)
+
+
+def legacy_render(data, w, h, loc):
+    """The chart pipeline before compositing in memory, up to the final encode."""
+    fnt = chart_font(loc)
+    imgs = []
+    for item in data:
+        image = Image.open(BytesIO(item[1])).convert("RGBA")
+        draw = ImageDraw.Draw(image)
+        height, text = album_caption(item[0])
+        draw.text(
+            (5, height),
+            text,
+            fill=(255, 255, 255, 255),
+            font=fnt,
+            stroke_width=1,
+            stroke_fill=(0, 0, 0),
+        )
+        file = BytesIO()
+        image.save(file, "png")
+        file.seek(0)
+        imgs.append(file)
+    final = Image.new("RGBA", (300 * w, 300 * h))
+    for i, file in enumerate(imgs):
+        new = Image.open(file)
+        x, y = (i % w) * 300, (i // w) * 300
+        final.paste(new, (x, y, x + new.size[0], y + new.size[1]))
+    if final.size[0] > 2100 and final.size[1] > 2100:
+        final = final.resize((2100, 2100), resample=Image.LANCZOS)
+    return final
+
+
+def timeit(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 5, 10])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for size in args.sizes:
+        data = make_chart(size, size)
+        tile_size = chart_tile_size(size, size)
+        tiles = [(text, make_tiles([cover], tile_size)[0]) for text, cover in data]
+        legacy = legacy_render(data, size, size, DATA)
+        current = current_render(data, size, size, DATA)
+        if tile_size == TILE_SIZE:
+            same = ImageChops.difference(legacy, current).getbbox() is None
+            check = "ok" if same else "DIFFERENT"
+        else:
+            same = legacy.size == current.size
+            check = f"{tile_size}px tiles" if same else "DIFFERENT SIZE"
+        failed = failed or not same
+        pipelines = {
+            "legacy": lambda: legacy_render(data, size, size, DATA),
+            "current": lambda: current_render(data, size, size, DATA),
+            "cached": lambda: render_chart(tiles, size, size, DATA, album_caption),
+        }
+        render = {name: timeit(func, args.repeat) for name, func in pipelines.items()}
+        total = {
+            name: timeit(lambda: encode_chart(func()), args.repeat)
+            for name, func in pipelines.items()
+        }
+        print(
+            f"{size:>2}x{size:<2} | render legacy {render['legacy'] * 1000:7.1f}ms "
+            f"current {render['current'] * 1000:7.1f}ms "
+            f"cached {render['cached'] * 1000:7.1f}ms | "
+            f"with encode legacy {total['legacy'] * 1000:7.1f}ms "
+            f"current {total['current'] * 1000:7.1f}ms "
+            f"cached {total['cached'] * 1000:7.1f}ms | {check}"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+End-to-end benchmarks of the guild wide commands against the fake Last.fm in fakefm.py.
+
+Usage:
+    python -m benchmarks.run [--sizes 10 100 1000 5000] [--repeat 5] [--latency 0.05]
+
+Every command is run `repeat` times for each guild size. Caches are cleared between runs
+unless --warm is passed. Reported are p50/p99 latency, requests sent per run by kind and
+peak traced memory.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import discord  # noqa: E402
+from redbot.core.utils import menus  # noqa: E402
+
+from benchmarks.fakefm import FakeLastFM  # noqa: E402
+from lastfm.lastfm import LastFM  # noqa: E402
+from lastfm.utils import api  # noqa: E402
+
+COMMANDS = {
+    "whoknows": ("command_whoknows", (), {"artistname": "Artist 1"}),
+    "server chart": ("server_chart", ("artist", "3x3"), {}),
+    "chart": ("command_chart", ("album", "5x5"), {}),
+    "server topartists": ("command_servertopartists", (), {}),
+    "server topalbums": ("command_servertopalbums", (), {}),
+    "server toptracks": ("command_servertoptracks", (), {}),
+}
+
+
+class _Nothing:
+    """Stand-in for discord objects, every attribute is an awaitable no-op."""
+
+    def __getattr__(self, name):
+        async def noop(*args, **kwargs):
+            return _Nothing()
+
+        return noop
+
+
+class FakeMember:
+    def __init__(self, id):
+        self.id = id
+        self.name = self.display_name = f"member{id}"
+        self.mention = f"<@{id}>"
+        self.color = 0
+        self.display_avatar = type("Avatar", (), {"url": ""})()
+
+
+class FakeGuild:
+    def __init__(self, size):
+        self.id = 1
+        self.name = f"guild of {size}"
+        self.icon = None
+        self.filesize_limit = 10 * 1024 * 1024
+        self.members = [FakeMember(i) for i in range(1, size + 1)]
+        self._members = {m.id: m for m in self.members}
+
+    def get_member(self, id):
+        return self._members.get(id)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeContext:
+    def __init__(self, bot, guild):
+        self.bot = bot
+        self.guild = guild
+        self.author = guild.members[0]
+        self.channel = None
+        self.message = type("Message", (), {"author": self.author})()
+        self.clean_prefix = "!"
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append((content, kwargs))
+        return _Nothing()
+
+    async def embed_color(self):
+        return 0
+
+    embed_colour = embed_color
+
+    @contextlib.asynccontextmanager
+    async def typing(self):
+        yield
+
+    async def send_help(self):
+        pass
+
+
+class FakeBot:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+
+    async def get_embed_color(self, channel):
+        return 0
+
+    async def wait_for(self, *args, **kwargs):
+        # menus give up straight away
+        raise asyncio.TimeoutError
+
+    async def wait_until_ready(self):
+        pass
+
+
+class _Value:
+    """Awaitable and usable as an async context manager, like Red's config values."""
+
+    def __init__(self, store, key, default):
+        self.store, self.key, self.default = store, key, default
+
+    def __call__(self):
+        return self
+
+    def __await__(self):
+        async def get():
+            return self.store.get(self.key, self.default)
+
+        return get().__await__()
+
+    async def __aenter__(self):
+        return self.store.setdefault(self.key, self.default)
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def set(self, value):
+        self.store[self.key] = value
+
+    async def clear(self):
+        self.store.pop(self.key, None)
+
+
+class _Group:
+    def __init__(self, store, defaults):
+        self.store, self.defaults = store, defaults
+
+    def __getattr__(self, key):
+        return _Value(self.store, key, self.defaults.get(key))
+
+    async def all(self):
+        return {**self.defaults, **self.store}
+
+
+class FakeConfig:
+    """In memory replacement for the small part of Red's Config the commands use."""
+
+    def __init__(self, users):
+        self.users = users
+        self.guilds = {}
+        self.globals = {}
+
+    async def all_users(self):
+        return self.users
+
+    def user(self, member):
+        return _Group(self.users.setdefault(member.id, {}), {"lastfm_username": None})
+
+    def guild(self, guild):
+        return _Group(self.guilds.setdefault(guild.id, {}), {"crowns": {}})
+
+    def __getattr__(self, key):
+        return _Value(self.globals, key, None)
+
+
+class BenchLastFM(LastFM):
+    """Points everything the cog downloads at the fake server."""
+
+    def __init__(self, bot, fake, data_loc):
+        self.fake = fake
+        # skip Red's Config and data path setup, they need a running bot
+        with _patched_red(data_loc):
+            super().__init__(bot)
+        self.token = "benchmark"
+        self.login_token = "benchmark"
+
+    def rewrite(self, url):
+        for prefix in ("https://www.last.fm", "https://last.fm"):
+            if url.startswith(prefix):
+                return self.fake.url + url[len(prefix) :]
+        return url
+
+    async def fetch(self, ctx, url, params=None, handling="json"):
+        return await super().fetch(ctx, self.rewrite(url), params, handling)
+
+    async def fetch_until(self, ctx, url, parser, *args, **kwargs):
+        return await super().fetch_until(ctx, self.rewrite(url), parser, *args, **kwargs)
+
+
+async def _menu(ctx, pages, controls, *args, **kwargs):
+    """Menus only display results, send the first page instead of waiting on reactions."""
+    await ctx.send(**({"embed": pages[0]} if isinstance(pages[0], discord.Embed) else {}))
+
+
+@contextlib.contextmanager
+def _patched_menus():
+    modules = [m for name, m in sys.modules.items() if name.startswith("lastfm")]
+    patched = [m for m in modules if getattr(m, "menu", None) is menus.menu]
+    for module in patched:
+        module.menu = _menu
+    try:
+        yield
+    finally:
+        for module in patched:
+            module.menu = menus.menu
+
+
+@contextlib.contextmanager
+def _patched_red(data_loc):
+    from redbot.core import Config
+
+    from lastfm import lastfm
+
+    original_conf, original_path = Config.get_conf, lastfm.bundled_data_path
+    Config.get_conf = classmethod(lambda cls, *args, **kwargs: _NullConfig())
+    lastfm.bundled_data_path = lambda cog: data_loc
+    try:
+        yield
+    finally:
+        Config.get_conf, lastfm.bundled_data_path = original_conf, original_path
+
+
+class _NullConfig:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, round(pct / 100 * (len(values) - 1)))
+    return values[index]
+
+
+async def run_command(cog, ctx, name):
+    attr, args, kwargs = COMMANDS[name]
+    command = getattr(cog, attr)
+    await command.callback(cog, ctx, *args, **kwargs)
+
+
+async def bench(args):
+    fake = await FakeLastFM(
+        latency=args.latency, error_rate=args.error_rate, server_error_rate=args.server_error_rate
+    ).start()
+    api.API_URL = f"{fake.url}/2.0/"
+    bot = FakeBot()
+    data_loc = ROOT / "lastfm" / "data"
+    results = []
+    try:
+        with _patched_menus():
+            for size in args.sizes:
+                results.extend(await bench_guild(args, bot, fake, data_loc, size))
+    finally:
+        await fake.close()
+    return results
+
+
+async def bench_guild(args, bot, fake, data_loc, size):
+    guild = FakeGuild(size)
+    users = {m.id: {"lastfm_username": f"user{m.id}"} for m in guild.members}
+    cog = BenchLastFM(bot, fake, data_loc)
+    cog.config = FakeConfig(users)
+    cog.configure_api_limits(args.rate, args.concurrency)
+    results = []
+    for name in args.commands:
+        timings = []
+        requests = Counter()
+        peak = 0
+        for _ in range(args.repeat):
+            if not args.warm:
+                cog.api_cache.clear()
+                cog.artist_images.clear()
+                cog.image_cache.clear()
+                cog.tile_cache.clear()
+                await cog.chart_cache.clear()
+            fake.reset_counters()
+            ctx = FakeContext(bot, guild)
+            tracemalloc.start()
+            start = time.perf_counter()
+            await run_command(cog, ctx, name)
+            timings.append(time.perf_counter() - start)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            requests.update(fake.requests)
+        results.append((size, name, timings, requests, peak))
+        print_result(size, name, timings, requests, peak, args.repeat)
+    cog.cog_unload()
+    await asyncio.sleep(0)
+    return results
+
+
+def print_result(size, name, timings, requests, peak, repeat):
+    per_run = ", ".join(f"{kind}={count / repeat:.0f}" for kind, count in sorted(requests.items()))
+    print(
+        f"{size:>5} users | {name:<18} | "
+        f"p50 {statistics.median(timings) * 1000:8.1f}ms | "
+        f"p99 {percentile(timings, 99) * 1000:8.1f}ms | "
+        f"peak {peak / 1024 / 1024:7.1f}MiB | {per_run}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--commands", nargs="+", default=list(COMMANDS), choices=list(COMMANDS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=1000.0, help="api requests per second")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warm", action="store_true", help="keep caches between runs")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,149 @@
 import asyncio
+import functools
+import os
 from io import BytesIO
 
 import discord
 from PIL import Image, ImageDraw, ImageFile, ImageFont
 from redbot.core import commands
-from redbot.core.utils import AsyncIter
 from redbot.core.utils.chat_formatting import escape
 
 from .abc import MixinMeta
 from .exceptions import *
 from .fmmixin import FMMixin
+from .utils.chartcache import chart_key
 
 NO_IMAGE_PLACEHOLDER = (
     "https://lastfm.freetls.fastly.net/i/u/300x300/2a96cbd8b46e442fc41c2b86b821562f.png"
 )
 ImageFile.LOAD_TRUNCATED_IMAGES = True
+# Seconds a downloaded cover is kept, urls of last.fm covers never change content.
+IMAGE_TTL = 86400
+MISSING_IMAGE_TTL = 600
+# Covers and artist images fetched at once for a single chart.
+IMAGE_CONCURRENCY = 16
+# Tiles are drawn at TILE_SIZE unless that would make the chart bigger than
+# MAX_CHART_SIZE, tiles smaller than MIN_TILE_SIZE aren't legible anymore.
+TILE_SIZE = 300
+MAX_CHART_SIZE = 2100
+MIN_TILE_SIZE = 100
+MAX_CHART_SIDE = MAX_CHART_SIZE // MIN_TILE_SIZE
+FONT_SIZE = 18
+# WebP qualities tried in order when a chart is too big to upload.
+QUALITIES = (80, 60, 40, 20)
+# Discord's upload limit outside of boosted guilds, used in DMs.
+UPLOAD_LIMIT = 10 * 1024 * 1024
 
 command_fm = FMMixin.command_fm
 command_fm_server = FMMixin.command_fm_server
 
 
+async def gather_bounded(aws, limit=IMAGE_CONCURRENCY):
+    """Like asyncio.gather, but with at most `limit` of the awaitables running at once."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*map(run, aws))
+
+
 class ChartMixin(MixinMeta):
     """Chart Commands"""
 
     async def get_img(self, url):
-        async with self.session.get(url or NO_IMAGE_PLACEHOLDER) as resp:
+        url = url or NO_IMAGE_PLACEHOLDER
+        img = self.image_cache.get(url)
+        if img is not None:
+            return img
+        # charts running at the same time share the download of a cover
+        return await self._image_downloads.run(url, lambda: self._download_img(url))
+
+    async def _download_img(self, url):
+        async with self.image_session.get(url) as resp:
             if resp.status == 200:
                 img = await resp.read()
+                self.image_cache.set(url, img, len(img), IMAGE_TTL)
                 return img
-            async with self.session.get(NO_IMAGE_PLACEHOLDER) as resp:
-                img = await resp.read()
-                return img
+        img = await self.get_img(NO_IMAGE_PLACEHOLDER) if url != NO_IMAGE_PLACEHOLDER else b""
+        # the cover may come back, don't hold on to the placeholder for long
+        self.image_cache.set(url, img, len(img), MISSING_IMAGE_TTL)
+        return img
+
+    async def get_imgs(self, urls):
+        """Get the covers of a whole chart, downloading each distinct url once."""
+        urls = [url or NO_IMAGE_PLACEHOLDER for url in urls]
+        unique = list(dict.fromkeys(urls))
+        images = dict(zip(unique, await gather_bounded(map(self.get_img, unique))))
+        return [images[url] for url in urls]
+
+    async def get_tiles(self, urls, size=TILE_SIZE):
+        """
+        Get the covers at `urls` as decoded chart tiles of `size` pixels.
+
+        Tiles are kept in the tile cache, so covers that show up in a lot of charts
+        are only decoded and resized once per tile size.
+        """
+        urls = [url or NO_IMAGE_PLACEHOLDER for url in urls]
+        tiles = {url: self.tile_cache.get((url, size)) for url in dict.fromkeys(urls)}
+        missing = [url for url, tile in tiles.items() if tile is None]
+        if missing:
+            covers = await self.get_imgs(missing)
+            made = await self.render_pool.render(make_tiles, covers, size)
+            placeholder = self.image_cache.get_stale(NO_IMAGE_PLACEHOLDER)
+            for url, cover, tile in zip(missing, covers, made):
+                tiles[url] = tile
+                missing_cover = url != NO_IMAGE_PLACEHOLDER and cover == placeholder
+                ttl = MISSING_IMAGE_TTL if missing_cover else IMAGE_TTL
+                self.tile_cache.set((url, size), tile, len(tile), ttl)
+        return [tiles[url] for url in urls]
+
+    async def artist_image_urls(self, ctx, artists):
+        """Image urls of several artists, each distinct artist is looked up once."""
+        unique = list(dict.fromkeys(artists))
+        urls = await gather_bounded(self.scrape_artist_image(artist, ctx) for artist in unique)
+        urls = dict(zip(unique, urls))
+        return [urls[artist] for artist in artists]
+
+    async def chart_image_urls(self, ctx, username, arguments, items):
+        """Image urls for the tiles of a user's chart."""
+        if arguments["method"] == "user.gettopartists":
+            if not self.login_token:
+                return [None] * len(items)
+            scraped_images = await self.scrape_artists_for_chart(
+                ctx, username, arguments["period"], arguments["amount"]
+            )
+            return [
+                scraped_images[i] if i < len(scraped_images) else None for i in range(len(items))
+            ]
+        if arguments["method"] == "user.gettoptracks":
+            # fills the artist image index, most track artists are in there
+            await self.scrape_artists_for_chart(
+                ctx, username, arguments["period"], arguments["amount"]
+            )
+            return await self.artist_image_urls(ctx, [track["artist"]["name"] for track in items])
+        return [item["image"][3]["#text"] for item in items]
+
+    async def draw_chart(self, job, texts, urls, arguments, limit):
+        if self.render_pool.mode == "process":
+            # raw tiles would be pickled through the pipe, about 17MB for a 10x10
+            # chart, so the workers get the encoded covers and decode them there
+            covers = await self.get_imgs(urls)
+            data, decode = list(zip(texts, covers)), True
+        else:
+            size = chart_tile_size(arguments["width"], arguments["height"])
+            tiles = await self.get_tiles(urls, size)
+            data, decode = list(zip(texts, tiles)), False
+        return await self.render_pool.render(
+            job,
+            data,
+            arguments["width"],
+            arguments["height"],
+            self.data_loc,
+            limit,
+            decode,
+        )
 
     @command_fm.command(
         name="chart", usage="[album | artist | recent | track] [timeframe] [width]x[height]"
@@ -45,11 +158,14 @@ class ChartMixin(MixinMeta):
         conf = await self.config.user(ctx.author).all()
         self.check_if_logged_in(conf)
         arguments = self.parse_chart_arguments(args)
-        if arguments["width"] + arguments["height"] > 31:  # TODO: Figure out a reasonable value.
+        if not (
+            0 < arguments["width"] <= MAX_CHART_SIDE and 0 < arguments["height"] <= MAX_CHART_SIDE
+        ):
             return await ctx.send(
-                "Size is too big! Chart `width` + `height` total must not exceed `31`"
+                f"Chart `width` and `height` must be between `1` and `{MAX_CHART_SIDE}`."
             )
         msg = await ctx.send("Gathering images and data, this may take some time.")
+        limit = ctx.guild.filesize_limit if ctx.guild else UPLOAD_LIMIT
         data = await self.api_request(
             ctx,
             {
@@ -59,133 +175,66 @@ class ChartMixin(MixinMeta):
                 "limit": arguments["amount"],
             },
         )
-        chart = []
         chart_type = "ERROR"
+        chart_total = arguments["width"] * arguments["height"]
+        job = charts
         async with ctx.typing():
             if arguments["method"] == "user.gettopalbums":
                 chart_type = "top album"
-                albums = data["topalbums"]["album"]
-                async for album in AsyncIter(albums[: arguments["width"] * arguments["height"]]):
-                    name = album["name"]
-                    artist = album["artist"]["name"]
-                    plays = album["playcount"]
-                    if album["image"][3]["#text"] in self.chart_data:
-                        chart_img = self.chart_data[album["image"][3]["#text"]]
-                    else:
-                        chart_img = await self.get_img(album["image"][3]["#text"])
-                        self.chart_data[album["image"][3]["#text"]] = chart_img
-                    chart.append(
-                        (
-                            f"{plays} {self.format_plays(plays)}\n{name} - {artist}",
-                            chart_img,
-                        )
-                    )
-                img = await self.bot.loop.run_in_executor(
-                    None,
-                    charts,
-                    chart,
-                    arguments["width"],
-                    arguments["height"],
-                    self.data_loc,
-                )
-
+                items = data["topalbums"]["album"][:chart_total]
+                texts = [
+                    f"{album['playcount']} {self.format_plays(album['playcount'])}\n"
+                    f"{album['name']} - {album['artist']['name']}"
+                    for album in items
+                ]
             elif arguments["method"] == "user.gettopartists":
                 chart_type = "top artist"
-                artists = data["topartists"]["artist"]
-                if self.login_token:
-                    scraped_images = await self.scrape_artists_for_chart(
-                        ctx, conf["lastfm_username"], arguments["period"], arguments["amount"]
-                    )
-                else:
-                    scraped_images = [NO_IMAGE_PLACEHOLDER] * arguments["amount"]
-                iterator = AsyncIter(artists[: arguments["width"] * arguments["height"]])
-                async for i, artist in iterator.enumerate():
-                    name = artist["name"]
-                    plays = artist["playcount"]
-                    if i < len(scraped_images) and scraped_images[i] in self.chart_data:
-                        chart_img = self.chart_data[scraped_images[i]]
-                    else:
-                        chart_img = await self.get_img(scraped_images[i])
-                        self.chart_data[scraped_images[i]] = chart_img
-                    chart.append(
-                        (
-                            f"{plays} {self.format_plays(plays)}\n{name}",
-                            chart_img,
-                        )
-                    )
-                img = await self.bot.loop.run_in_executor(
-                    None,
-                    charts,
-                    chart,
-                    arguments["width"],
-                    arguments["height"],
-                    self.data_loc,
-                )
-
+                items = data["topartists"]["artist"][:chart_total]
+                texts = [
+                    f"{artist['playcount']} {self.format_plays(artist['playcount'])}\n"
+                    f"{artist['name']}"
+                    for artist in items
+                ]
             elif arguments["method"] == "user.getrecenttracks":
                 chart_type = "recent tracks"
-                tracks = data["recenttracks"]["track"]
-                if isinstance(tracks, dict):
-                    tracks = [tracks]
-                async for track in AsyncIter(tracks[: arguments["width"] * arguments["height"]]):
-                    name = track["name"]
-                    artist = track["artist"]["#text"]
-                    if track["image"][3]["#text"] in self.chart_data:
-                        chart_img = self.chart_data[track["image"][3]["#text"]]
-                    else:
-                        chart_img = await self.get_img(track["image"][3]["#text"])
-                        self.chart_data[track["image"][3]["#text"]] = chart_img
-                    chart.append(
-                        (
-                            f"{name} - {artist}",
-                            chart_img,
-                        )
-                    )
-                img = await self.bot.loop.run_in_executor(
-                    None,
-                    track_chart,
-                    chart,
-                    arguments["width"],
-                    arguments["height"],
-                    self.data_loc,
-                )
+                job = track_chart
+                items = data["recenttracks"]["track"]
+                if isinstance(items, dict):
+                    items = [items]
+                items = items[:chart_total]
+                texts = [f"{track['name']} - {track['artist']['#text']}" for track in items]
             elif arguments["method"] == "user.gettoptracks":
                 chart_type = "top tracks"
-                tracks = data["toptracks"]["track"]
-                scraped_images = await self.scrape_artists_for_chart(
-                    ctx, conf["lastfm_username"], arguments["period"], arguments["amount"]
-                )
-                if isinstance(tracks, dict):
-                    tracks = [tracks]
-                async for track in AsyncIter(tracks[: arguments["width"] * arguments["height"]]):
-                    name = track["name"]
-                    artist = track["artist"]["name"]
-                    plays = track["playcount"]
-                    if name in self.chart_data:
-                        chart_img = self.chart_data[name]
-                    else:
-                        chart_img = await self.get_img(await self.scrape_artist_image(artist, ctx))
-                        self.chart_data[name] = chart_img
-                    chart.append(
-                        (
-                            f"{plays} {self.format_plays(plays)}\n{name} - {artist}",
-                            chart_img,
-                        )
-                    )
-                img = await self.bot.loop.run_in_executor(
-                    None,
-                    charts,
-                    chart,
-                    arguments["width"],
-                    arguments["height"],
-                    self.data_loc,
-                )
+                items = data["toptracks"]["track"]
+                if isinstance(items, dict):
+                    items = [items]
+                items = items[:chart_total]
+                texts = [
+                    f"{track['playcount']} {self.format_plays(track['playcount'])}\n"
+                    f"{track['name']} - {track['artist']['name']}"
+                    for track in items
+                ]
+            # the same top list makes the same chart, no need to draw it again
+            key = chart_key(
+                conf["lastfm_username"],
+                arguments["method"],
+                arguments["period"],
+                arguments["width"],
+                arguments["height"],
+                texts,
+                limit,
+            )
+            img = await self.chart_cache.get(key)
+            if img is None:
+                urls = await self.chart_image_urls(ctx, conf["lastfm_username"], arguments, items)
+                img = await self.draw_chart(job, texts, urls, arguments, limit)
+                await self.chart_cache.set(key, img)
         await msg.delete()
         u = conf["lastfm_username"]
         try:
             await ctx.send(
                 f"`{u} - {self.humanized_period(arguments['period'])} - {arguments['width']}x{arguments['height']} {chart_type} chart`",
-                file=img,
+                file=chart_file(img),
             )
         except discord.HTTPException:
             await ctx.send("File is to big to send, try lowering the size.")
@@ -197,9 +246,11 @@ class ChartMixin(MixinMeta):
     async def server_chart(self, ctx, *args):
         """Visual chart of the servers albums, artists or tracks."""
         arguments = self.parse_chart_arguments(args)
-        if arguments["width"] + arguments["height"] > 31:  # TODO: Figure out a reasonable value.
+        if not (
+            0 < arguments["width"] <= MAX_CHART_SIDE and 0 < arguments["height"] <= MAX_CHART_SIDE
+        ):
             return await ctx.send(
-                "Size is too big! Chart `width` + `height` total must not exceed `31`"
+                f"Chart `width` and `height` must be between `1` and `{MAX_CHART_SIDE}`."
             )
         if arguments["method"] not in [
             "user.gettopalbums",
@@ -209,6 +260,7 @@ class ChartMixin(MixinMeta):
             return await ctx.send("Only albums, artists and tracks are supported.")
         chart_total = arguments["width"] * arguments["height"]
         msg = await ctx.send("Gathering images and data, this may take some time.")
+        limit = ctx.guild.filesize_limit
         tasks = []
         userlist = await self.config.all_users()
         guildusers = [x.id for x in ctx.guild.members]
@@ -235,7 +287,6 @@ class ChartMixin(MixinMeta):
                     arguments["amount"],
                 )
             )
-        chart = []
         chart_type = "ERROR"
         if not tasks:
             return await ctx.send("No users have set their last.fm username yet.")
@@ -248,16 +299,13 @@ class ChartMixin(MixinMeta):
                     if user_data is None:
                         continue
                     for album in user_data:
-                        album_name = album["name"]
-                        artist = album["artist"]["name"]
-                        name = f"{album_name} — {artist}"
-                        plays = int(album["playcount"])
+                        name = f"{album.name} — {album.artist}"
                         if name in content_map:
-                            content_map[name]["plays"] += plays
+                            content_map[name]["plays"] += album.playcount
                         else:
                             content_map[name] = {
-                                "plays": plays,
-                                "link": album["image"][3]["#text"],
+                                "plays": album.playcount,
+                                "link": album.image,
                             }
             elif arguments["method"] == "user.gettopartists":
                 chart_type = "top artist"
@@ -265,157 +313,188 @@ class ChartMixin(MixinMeta):
                     if user_data is None:
                         continue
                     for artist in user_data:
-                        name = artist["name"]
-                        plays = int(artist["playcount"])
-                        if name in content_map:
-                            content_map[name]["plays"] += plays
+                        if artist.name in content_map:
+                            content_map[artist.name]["plays"] += artist.playcount
                         else:
-                            content_map[name] = {"plays": plays}
+                            content_map[artist.name] = {"plays": artist.playcount}
             elif arguments["method"] == "user.gettoptracks":
                 chart_type = "top tracks"
                 for user in data:
                     if user is None:
                         continue
                     for user_data in user:
-                        name = f'{escape(user_data["artist"]["name"])} — *{escape(user_data["name"])}*'
-                        plays = int(user_data["playcount"])
+                        name = f"{escape(user_data.artist)} — *{escape(user_data.name)}*"
                         if name in content_map:
-                            content_map[name]["plays"] += plays
+                            content_map[name]["plays"] += user_data.playcount
                         else:
                             content_map[name] = {
-                                "plays": plays,
-                                "link": user_data["artist"]["name"],
+                                "plays": user_data.playcount,
+                                "link": user_data.artist,
                             }
-        cached_images = {}
-        for i, (name, content_data) in enumerate(
-            sorted(content_map.items(), key=lambda x: x[1]["plays"], reverse=True), start=1
-        ):
-            if arguments["method"] == "user.gettopartists":
-                image = await self.get_img(await self.scrape_artist_image(name, ctx))
-            elif arguments["method"] == "user.gettoptracks":
-                if content_data["link"] in cached_images:
-                    image = cached_images[content_data["link"]]
-                else:
-                    image = await self.get_img(
-                        await self.scrape_artist_image(content_data["link"], ctx)
-                    )
-                    cached_images[content_data["link"]] = image
-            else:
-                image = await self.get_img(content_data["link"])
-            chart.append(
-                (
-                    f"{content_data['plays']} {self.format_plays(content_data['plays'])}\n{name}",
-                    image,
-                )
-            )
-            if i >= chart_total:
-                break
-        img = await self.bot.loop.run_in_executor(
-            None,
-            charts,
-            chart,
+        top = sorted(content_map.items(), key=lambda x: x[1]["plays"], reverse=True)
+        top = top[:chart_total]
+        texts = [
+            f"{content['plays']} {self.format_plays(content['plays'])}\n{name}"
+            for name, content in top
+        ]
+        key = chart_key(
+            ctx.guild.id,
+            arguments["method"],
+            arguments["period"],
             arguments["width"],
             arguments["height"],
-            self.data_loc,
+            texts,
+            limit,
         )
+        img = await self.chart_cache.get(key)
+        if img is None:
+            if arguments["method"] == "user.gettopartists":
+                urls = await self.artist_image_urls(ctx, [name for name, _ in top])
+            elif arguments["method"] == "user.gettoptracks":
+                urls = await self.artist_image_urls(ctx, [content["link"] for _, content in top])
+            else:
+                urls = [content["link"] for _, content in top]
+            img = await self.draw_chart(charts, texts, urls, arguments, limit)
+            await self.chart_cache.set(key, img)
         await msg.delete()
         try:
             await ctx.send(
                 f"`{ctx.guild} - {self.humanized_period(arguments['period'])} - {arguments['width']}x{arguments['height']} {chart_type} chart`",
-                file=img,
+                file=chart_file(img),
             )
         except discord.HTTPException:
             await ctx.send("File is to big to send, try lowering the size.")
 
 
-def charts(data, w, h, loc):
-    fnt_file = f"{loc}/fonts/Arial Unicode.ttf"
-    fnt = ImageFont.truetype(fnt_file, 18, encoding="utf-8")
-    imgs = []
-    for item in data:
-        img = BytesIO(item[1])
-        image = Image.open(img).convert("RGBA")
-        draw = ImageDraw.Draw(image)
-        texts = item[0].split("\n")
-        if len(texts[1]) > 30:
-            height = 223
-            text = f"{texts[0]}\n{texts[1][:30]}\n{texts[1][30:]}"
-        else:
-            height = 247
-            text = item[0]
-        draw.text(
-            (5, height),
-            text,
-            fill=(255, 255, 255, 255),
-            font=fnt,
-            stroke_width=1,
-            stroke_fill=(0, 0, 0),
-        )
-        _file = BytesIO()
-        image.save(_file, "png")
-        _file.name = f"{item[0]}.png"
-        _file.seek(0)
-        imgs.append(_file)
-    return create_graph(imgs, w, h)
-
-
-def track_chart(data, w, h, loc):
-    fnt_file = f"{loc}/fonts/Arial Unicode.ttf"
-    fnt = ImageFont.truetype(fnt_file, 18, encoding="utf-8")
-    imgs = []
-    for item in data:
-        img = BytesIO(item[1])
-        image = Image.open(img).convert("RGBA")
-        draw = ImageDraw.Draw(image)
-        if len(item[0]) > 30:
-            height = 243
-            text = f"{item[0][:30]}\n{item[0][30:]}"
-        else:
-            height = 267
-            text = item[0]
-        draw.text(
-            (5, height),
+# Arial Unicode isn't bundled but covers more scripts, use it when it was added
+FONTS = ("Arial Unicode.ttf", "NotoSansMono-Regular.ttf")
+
+
+@functools.lru_cache(maxsize=16)
+def chart_font(loc, size=FONT_SIZE):
+    for name in FONTS:
+        path = os.path.join(str(loc), "fonts", name)
+        if os.path.exists(path):
+            return ImageFont.truetype(path, size, encoding="utf-8")
+    return ImageFont.load_default()
+
+
+def chart_tile_size(w, h):
+    return min(TILE_SIZE, MAX_CHART_SIZE // max(w, h))
+
+
+def album_caption(text):
+    """
+    Where to draw the "plays\nname" caption of a TILE_SIZE tile and the wrapped text.
+    """
+    texts = text.split("\n")
+    if len(texts[1]) > 30:
+        return 223, f"{texts[0]}\n{texts[1][:30]}\n{texts[1][30:]}"
+    return 247, text
+
+
+def track_caption(text):
+    if len(text) > 30:
+        return 243, f"{text[:30]}\n{text[30:]}"
+    return 267, text
+
+
+# Render jobs for the render pool, they only take and return bytes and strings.
+# With `decode` set `data` holds encoded covers instead of tiles.
+def charts(data, w, h, loc, limit=None, decode=False):
+    if decode:
+        data = decode_covers(data, chart_tile_size(w, h))
+    return encode_chart(render_chart(data, w, h, loc, album_caption), limit)
+
+
+def track_chart(data, w, h, loc, limit=None, decode=False):
+    if decode:
+        data = decode_covers(data, chart_tile_size(w, h))
+    return encode_chart(render_chart(data, w, h, loc, track_caption), limit)
+
+
+def make_tile(cover, size=TILE_SIZE):
+    """Decode a cover into the raw RGBA pixels of a `size` x `size` chart tile."""
+    try:
+        tile = Image.open(BytesIO(cover)).convert("RGBA")
+    except (OSError, ValueError):
+        # an empty tile beats failing the whole chart over one broken cover
+        tile = Image.new("RGBA", (size, size))
+    if tile.size != (size, size):
+        tile = tile.resize((size, size), resample=Image.LANCZOS)
+    return tile.tobytes()
+
+
+def make_tiles(covers, size=TILE_SIZE):
+    return [make_tile(cover, size) for cover in covers]
+
+
+def decode_covers(data, size):
+    """Turn (caption, cover) pairs into the (caption, tile) pairs render_chart takes."""
+    return [(text, make_tile(cover, size)) for text, cover in data]
+
+
+def render_chart(data, w, h, loc, caption):
+    """
+    Draw the chart tiles straight onto the final canvas.
+
+    `data` are (caption, tile) pairs with tiles from make_tile at the size
+    chart_tile_size picks, so the chart is drawn at its final resolution. Tiles are
+    captioned in place and pasted, nothing is encoded until the whole chart is done.
+    """
+    size = chart_tile_size(w, h)
+    scale = size / TILE_SIZE
+    fnt = chart_font(loc, max(round(FONT_SIZE * scale), 1))
+    final = Image.new("RGBA", (size * w, size * h))
+    for i, (text, pixels) in enumerate(data):
+        tile = Image.frombytes("RGBA", (size, size), pixels)
+        height, text = caption(text)
+        # drawn on the tile so long captions are cut off at its edge
+        ImageDraw.Draw(tile).text(
+            (round(5 * scale), round(height * scale)),
             text,
             fill=(255, 255, 255, 255),
             font=fnt,
             stroke_width=1,
             stroke_fill=(0, 0, 0),
         )
-        _file = BytesIO()
-        image.save(_file, "png")
-        _file.name = f"{item[0]}.png"
-        _file.seek(0)
-        imgs.append(_file)
-    return create_graph(imgs, w, h)
-
-
-def chunks(l, n):
-    """Yield successive n-sized chunks from l."""
-    for i in range(0, len(l), n):
-        yield l[i : i + n]
-
-
-def create_graph(data, w, h):
-    dimensions = (300 * w, 300 * h)
-    final = Image.new("RGBA", dimensions)
-    images = chunks(data, w)
-    y = 0
-    for chunked in images:
-        x = 0
-        for img in chunked:
-            new = Image.open(img)
-            w, h = new.size
-            final.paste(new, (x, y, x + w, y + h))
-            x += 300
-        y += 300
-    w, h = final.size
-    if w > 2100 and h > 2100:
-        final = final.resize(
-            (2100, 2100), resample=Image.ANTIALIAS
-        )  # Resize cause a 6x6k image is blocking when being sent
+        final.paste(tile, ((i % w) * size, (i // w) * size))
+    return final
+
+
+def encode_webp(image, quality):
     file = BytesIO()
-    final.save(file, "webp")
-    file.name = f"chart.webp"
-    file.seek(0)
-    image = discord.File(file)
-    return image
+    image.save(file, "webp", quality=quality)
+    return file.getvalue()
+
+
+def encode_chart(final, limit=None):
+    """
+    Encode a chart as WebP, no bigger than `limit` bytes when one is given.
+
+    Lower qualities are tried before the chart is scaled down. Which quality fits is
+    estimated on a quarter sized sample, so it usually takes one more full encode.
+    """
+    data = encode_webp(final, QUALITIES[0])
+    image = final
+    while limit is not None and len(data) > limit and min(image.size) > MIN_TILE_SIZE:
+        sample = image.reduce(2)
+        ratio = len(data) / len(encode_webp(sample, QUALITIES[0]))
+        estimate = next(
+            (q for q in QUALITIES[1:] if len(encode_webp(sample, q)) * ratio <= limit),
+            QUALITIES[-1],
+        )
+        for quality in QUALITIES[QUALITIES.index(estimate) :]:
+            data = encode_webp(image, quality)
+            if len(data) <= limit:
+                return data
+        # not even the lowest quality fits, scale down to about the size that would
+        factor = min((limit / len(data)) ** 0.5, 0.9)
+        size = (max(int(image.size[0] * factor), 1), max(int(image.size[1] * factor), 1))
+        image = image.resize(size, resample=Image.LANCZOS)
+        data = encode_webp(image, QUALITIES[0])
+    return data
+
+
+def chart_file(data):
+    return discord.File(BytesIO(data), filename="chart.webp")
@@ -1,5 +1,7 @@
 class LastFMError(Exception):
-    pass
+    def __init__(self, *args, code=None):
+        super().__init__(*args)
+        self.code = code
 
 
 class NotLoggedInError(LastFMError):
@@ -20,3 +22,11 @@ class NoScrobblesError(LastFMError):
 
 class NotScrobblingError(LastFMError):
     pass
+
+
+class LastFMUnavailableError(LastFMError):
+    pass
+
+
+class ChartRenderError(LastFMError):
+    pass
@@ -2,10 +2,9 @@ import asyncio
 import urllib.parse
 from operator import itemgetter
 
-import aiohttp
 import discord
 from redbot.core import Config, commands
-from redbot.core.data_manager import bundled_data_path
+from redbot.core.data_manager import bundled_data_path, cog_data_path
 from redbot.core.utils.chat_formatting import escape, pagify
 from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 
@@ -21,8 +20,20 @@ from .recent import RecentMixin
 from .scrobbler import ScrobblerMixin
 from .tags import TagsMixin
 from .top import TopMixin
+from .utils.artistimages import ArtistImageIndex
 from .utils.base import UtilsMixin
+from .utils.cache import NegativeCache, ResponseCache
+from .utils.chartcache import ChartCache
+from .utils.http import POOLS, create_session
+from .utils.lyrics import LyricsCache
+from .utils.metadata import MetadataStore
+from .utils.parsepool import ParsePool
+from .utils.ratelimit import RateLimiter
+from .utils.renderpool import RenderPool
+from .utils.retry import CircuitBreaker, RetryPolicy
+from .utils.singleflight import SingleFlight
 from .utils.tokencheck import *
+from .utils.workerpool import check_mode
 from .whoknows import WhoKnowsMixin
 from .wordcloud import WordCloudMixin
 
@@ -58,21 +69,50 @@ class LastFM(
         self.bot = bot
         self.config = Config.get_conf(self, identifier=95932766180343808, force_registration=True)
         defaults = {"lastfm_username": None, "session_key": None, "scrobbles": 0, "scrobble": True}
-        self.config.register_global(version=1)
+        self.config.register_global(
+            version=1,
+            api_rate=5.0,
+            api_concurrency=10,
+            parse_mode="thread",
+            parse_workers=2,
+            image_cache_mb=64,
+            tile_cache_mb=32,
+            render_mode="thread",
+            render_workers=2,
+            chart_cache_mb=16,
+            chart_disk_cache_mb=0,
+        )
         self.config.register_user(**defaults)
         self.config.register_guild(crowns={})
-        self.session = aiohttp.ClientSession(
-            headers={
-                "User-Agent": "Mozilla/5.0 (X11; Arch Linux; Linux x86_64; rv:66.0) Gecko/20100101 Firefox/66.0"
-            },
-        )
+        self.api_session = create_session(**POOLS["api"])
+        self.session = create_session(**POOLS["scrape"])
+        self.image_session = create_session(**POOLS["image"])
+        # replaced api sessions and the tasks that close them once they are idle
+        self.retired_sessions = {}
+        self.api_cache = ResponseCache()
+        self.metadata_store = None
+        self.negative_cache = NegativeCache()
+        self.artist_images = ArtistImageIndex()
+        self.library_cache = ResponseCache(max_bytes=4 * 1024 * 1024)
+        self._library_requests = SingleFlight()
+        self.lyrics_cache = LyricsCache()
+        self.image_cache = ResponseCache(max_bytes=64 * 1024 * 1024, ttls={})
+        self._image_downloads = SingleFlight()
+        # decoded covers, 352 KiB each
+        self.tile_cache = ResponseCache(max_bytes=32 * 1024 * 1024, ttls={})
+        self.parse_pool = ParsePool()
+        self.render_pool = RenderPool()
+        self.chart_cache = ChartCache()
+        self._inflight_requests = SingleFlight()
+        self.api_limiter = RateLimiter()
+        self.api_retry = RetryPolicy()
+        self.api_breaker = CircuitBreaker()
+        self.scrape_retry = RetryPolicy(attempts=2)
         self.token = None
         self.wc = None
         self.login_token = None
         self.wordcloud_create()
         self.data_loc = bundled_data_path(self)
-        self.chart_data = {}
-        self.chart_data_loop = self.bot.loop.create_task(self.chart_clear_loop())
 
     def format_help_for_context(self, ctx):
         pre_processed = super().format_help_for_context(ctx)
@@ -81,19 +121,53 @@ class LastFM(
     async def red_delete_data_for_user(self, *, requester, user_id):
         await self.config.user_from_id(user_id).clear()
 
-    async def chart_clear_loop(self):
-        await self.bot.wait_until_ready()
-        while True:
-            self.chart_data = {}
-            await asyncio.sleep(1800)
-
     async def initialize(self):
         token = await self.bot.get_shared_api_tokens("lastfm")
         self.token = token.get("appid")
         self.secret = token.get("secret")
         self.login_token = token.get("logintoken")
+        self.metadata_store = MetadataStore(cog_data_path(self) / "metadata.sqlite3")
+        await self.metadata_store.open()
+        self.artist_images.store = self.metadata_store
+        self.lyrics_cache.store = self.metadata_store
+        self.configure_api_limits(
+            await self.config.api_rate(), await self.config.api_concurrency()
+        )
+        # a saved mode may not be usable on this platform, e.g. after moving the bot
+        parse_mode, render_mode = await self.config.parse_mode(), await self.config.render_mode()
+        self.parse_pool.configure(
+            "thread" if check_mode(parse_mode) else parse_mode, await self.config.parse_workers()
+        )
+        self.render_pool.configure(
+            "thread" if check_mode(render_mode) else render_mode,
+            await self.config.render_workers(),
+        )
+        self.image_cache.resize(await self.config.image_cache_mb() * 1024 * 1024)
+        self.tile_cache.resize(await self.config.tile_cache_mb() * 1024 * 1024)
+        await self.chart_cache.configure(
+            await self.config.chart_cache_mb() * 1024 * 1024,
+            cog_data_path(self) / "charts",
+            await self.config.chart_disk_cache_mb() * 1024 * 1024,
+        )
         await self.migrate_config()
 
+    def configure_api_limits(self, rate, concurrency):
+        self.api_limiter.configure(rate, concurrency)
+        if self.api_session.connector.limit_per_host == concurrency:
+            return
+        # match the api connection pool to the amount of requests allowed in flight
+        old_session = self.api_session
+        self.api_session = create_session(limit=concurrency, limit_per_host=concurrency)
+        self.retired_sessions[old_session] = self.bot.loop.create_task(
+            self.close_session_later(old_session)
+        )
+
+    async def close_session_later(self, session):
+        # let requests still using the old pool finish before closing it
+        await asyncio.sleep(session.timeout.total or 0)
+        self.retired_sessions.pop(session, None)
+        await session.close()
+
     async def migrate_config(self):
         if await self.config.version() == 1:
             a = {}
@@ -116,12 +190,20 @@ class LastFM(
             self.login_token = api_tokens.get("logintoken")
 
     def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
-        if self.chart_data_loop:
-            self.chart_data_loop.cancel()
+        for task in self.retired_sessions.values():
+            task.cancel()
+        sessions = (self.api_session, self.session, self.image_session, *self.retired_sessions)
+        for session in sessions:
+            self.bot.loop.create_task(session.close())
+        self.retired_sessions.clear()
+        if self.metadata_store:
+            self.bot.loop.create_task(self.metadata_store.close())
+        self.parse_pool.close()
+        self.render_pool.close()
+        self.chart_cache.close()
 
     @commands.is_owner()
-    @commands.command(name="lastfmset", aliases=["fmset"])
+    @commands.group(name="lastfmset", aliases=["fmset"], invoke_without_command=True)
     async def command_lastfmset(self, ctx):
         """Instructions on how to set the api key."""
         message = (
@@ -139,6 +221,203 @@ class LastFM(
         )
         await ctx.maybe_send_embed(message)
 
+    @command_lastfmset.command(name="stats")
+    async def command_lastfmset_stats(self, ctx):
+        """Show api client statistics."""
+        stats = self.api_cache.stats()
+        sections = [
+            "**API cache**\n"
+            f"Entries: {stats['entries']} ({stats['bytes'] // 1024} KiB)\n"
+            f"Hits: {stats['hits']} | Misses: {stats['misses']} | "
+            f"Hit rate: {stats['hit_rate']:.1%}\n"
+            f"Evictions: {stats['evictions']}\n"
+            f"Negative entries: {len(self.negative_cache)} | "
+            f"Negative hits: {self.negative_cache.hits}"
+        ]
+        if self.metadata_store:
+            stored = await self.metadata_store.stats()
+            sections.append(
+                "**Metadata store**\n"
+                f"Entries: {stored['entries']} ({stored['bytes'] // 1024} KiB)\n"
+                f"Hits: {stored['hits']} | Misses: {stored['misses']}"
+            )
+        library = self.library_cache.stats()
+        sections.append(
+            "**Library pages**\n"
+            f"Entries: {library['entries']} | Hits: {library['hits']} | "
+            f"Misses: {library['misses']}"
+        )
+        cached = self.image_cache.stats()
+        sections.append(
+            "**Image cache**\n"
+            f"Entries: {cached['entries']} ({cached['bytes'] // 1024 // 1024} of "
+            f"{self.image_cache.max_bytes // 1024 // 1024} MiB)\n"
+            f"Hits: {cached['hits']} | Misses: {cached['misses']} | "
+            f"Hit rate: {cached['hit_rate']:.1%} | Evictions: {cached['evictions']}"
+        )
+        tiles = self.tile_cache.stats()
+        sections.append(
+            "**Chart tiles**\n"
+            f"Entries: {tiles['entries']} ({tiles['bytes'] // 1024 // 1024} of "
+            f"{self.tile_cache.max_bytes // 1024 // 1024} MiB)\n"
+            f"Hits: {tiles['hits']} | Misses: {tiles['misses']} | "
+            f"Hit rate: {tiles['hit_rate']:.1%} | Evictions: {tiles['evictions']}"
+        )
+        finished = self.chart_cache.stats()
+        sections.append(
+            "**Finished charts**\n"
+            f"Memory: {finished['entries']} ({finished['bytes'] // 1024 // 1024} of "
+            f"{self.chart_cache.memory.max_bytes // 1024 // 1024} MiB) | "
+            f"Disk: {finished['disk_entries']} ({finished['disk_bytes'] // 1024 // 1024} of "
+            f"{self.chart_cache.max_disk_bytes // 1024 // 1024} MiB)\n"
+            f"Hits: {finished['hits']} | Disk hits: {finished['disk_hits']} | "
+            f"Misses: {finished['misses'] - finished['disk_hits']}"
+        )
+        lyrics = self.lyrics_cache.stats()
+        sections.append(
+            "**Lyrics cache**\n"
+            f"Entries: {lyrics['entries']} ({lyrics['bytes'] // 1024} KiB) | "
+            f"Hits: {lyrics['hits']} | Misses: {lyrics['misses']}"
+        )
+        images = self.artist_images.stats()
+        sections.append(
+            "**Artist images**\n"
+            f"Entries: {images['entries']} | Hits: {images['hits']} | "
+            f"Misses: {images['misses']} | Refreshes: {images['refreshes']}"
+        )
+        sections.append(
+            "**Rate limiter**\n"
+            f"{self.api_limiter.rate} requests/s, "
+            f"{self.api_limiter.max_concurrency} max in flight\n"
+            f"In flight: {self.api_limiter.active} | Queued: {self.api_limiter.queued}"
+        )
+        sections.append(
+            "**Retries**\n"
+            f"Api: {self.api_retry.retries} | Scraping: {self.scrape_retry.retries}\n"
+            f"Circuit: {'open' if self.api_breaker.is_open else 'closed'} | "
+            f"Trips: {self.api_breaker.trips} | "
+            f"Time open: {self.api_breaker.open_time:.0f}s"
+        )
+        parsing = self.parse_pool.stats()
+        sections.append(
+            "**Html parsing**\n"
+            f"{parsing['workers']} {parsing['mode']} workers using {parsing['backend']}\n"
+            f"Parsing: {parsing['active']} | Queued: {parsing['queued']}\n"
+            f"Pages: {parsing['done']} | Errors: {parsing['errors']}\n"
+            f"Avg: {parsing['avg_time'] * 1000:.1f}ms | "
+            f"Max: {parsing['max_time'] * 1000:.1f}ms"
+        )
+        rendering = self.render_pool.stats()
+        sections.append(
+            "**Chart rendering**\n"
+            f"{rendering['workers']} {rendering['mode']} workers\n"
+            f"Rendering: {rendering['active']} | Queued: {rendering['queued']}\n"
+            f"Charts: {rendering['done']} | Rejected: {rendering['rejected']} | "
+            f"Timeouts: {rendering['timeouts']} | Errors: {rendering['errors']}\n"
+            f"Avg: {rendering['avg_time'] * 1000:.0f}ms | "
+            f"Max: {rendering['max_time'] * 1000:.0f}ms"
+        )
+        message = "\n\n".join(sections)
+        await ctx.maybe_send_embed(message)
+
+    @command_lastfmset.command(name="ratelimit")
+    async def command_lastfmset_ratelimit(self, ctx, rate: float, concurrency: int):
+        """
+        Set the api request budget.
+
+        `rate` is the amount of requests per second and `concurrency` the max amount of
+        requests in flight at once. Last.fm allows an average of 5 requests per second.
+        """
+        if rate <= 0 or concurrency < 1:
+            return await ctx.send("Rate and concurrency must both be positive.")
+        await self.config.api_rate.set(rate)
+        await self.config.api_concurrency.set(concurrency)
+        self.configure_api_limits(rate, concurrency)
+        await ctx.send(f"Api requests are now limited to {rate}/s with {concurrency} in flight.")
+
+    @command_lastfmset.command(name="imagecache")
+    async def command_lastfmset_imagecache(self, ctx, megabytes: int):
+        """Set how much memory downloaded chart covers may use."""
+        if megabytes < 0:
+            return await ctx.send("The cache size can't be negative.")
+        await self.config.image_cache_mb.set(megabytes)
+        self.image_cache.resize(megabytes * 1024 * 1024)
+        await ctx.send(f"Chart covers now use up to {megabytes} MiB.")
+
+    @command_lastfmset.command(name="tilecache")
+    async def command_lastfmset_tilecache(self, ctx, megabytes: int):
+        """Set how much memory decoded chart tiles may use, a tile takes about 350 KiB."""
+        if megabytes < 0:
+            return await ctx.send("The cache size can't be negative.")
+        await self.config.tile_cache_mb.set(megabytes)
+        self.tile_cache.resize(megabytes * 1024 * 1024)
+        await ctx.send(f"Decoded chart tiles now use up to {megabytes} MiB.")
+
+    @command_lastfmset.command(name="chartcache")
+    async def command_lastfmset_chartcache(self, ctx, megabytes: int, disk_megabytes: int = 0):
+        """
+        Set how much memory and disk space finished charts may use.
+
+        Charts are sent again from the cache while the top list they show hasn't
+        changed. The disk cache is off while `disk_megabytes` is 0, turning it
+        off deletes the charts it saved.
+        """
+        if megabytes < 0 or disk_megabytes < 0:
+            return await ctx.send("The cache size can't be negative.")
+        await self.config.chart_cache_mb.set(megabytes)
+        await self.config.chart_disk_cache_mb.set(disk_megabytes)
+        await self.chart_cache.configure(
+            megabytes * 1024 * 1024, cog_data_path(self) / "charts", disk_megabytes * 1024 * 1024
+        )
+        await ctx.send(
+            f"Finished charts now use up to {megabytes} MiB of memory "
+            f"and {disk_megabytes} MiB of disk."
+        )
+
+    @command_lastfmset.command(name="parsing")
+    async def command_lastfmset_parsing(self, ctx, mode: str, workers: int):
+        """
+        Set how scraped pages are parsed.
+
+        `mode` is either `thread` or `process`, `workers` the size of the pool. Process
+        workers keep big guild commands from slowing down the rest of the bot, but they
+        are forked from the running bot and can hang on a lock another thread held at
+        the time. They are only available where fork is. Stick to `thread` unless
+        parsing is slowing the bot down.
+        """
+        mode = mode.lower()
+        error = check_mode(mode)
+        if error is not None:
+            return await ctx.send(error)
+        if workers < 1:
+            return await ctx.send("Workers must be positive.")
+        await self.config.parse_mode.set(mode)
+        await self.config.parse_workers.set(workers)
+        self.parse_pool.configure(mode, workers)
+        await ctx.send(f"Pages are now parsed by {workers} {mode} workers.")
+
+    @command_lastfmset.command(name="rendering")
+    async def command_lastfmset_rendering(self, ctx, mode: str, workers: int):
+        """
+        Set how charts are rendered.
+
+        `mode` is either `thread` or `process`, `workers` the size of the pool. Process
+        workers don't hold up the bot while big charts are drawn, but they are forked
+        from the running bot and can hang on a lock another thread held at the time.
+        They are only available where fork is. Stick to `thread` unless charts are
+        slowing the bot down.
+        """
+        mode = mode.lower()
+        error = check_mode(mode)
+        if error is not None:
+            return await ctx.send(error)
+        if workers < 1:
+            return await ctx.send("Workers must be positive.")
+        await self.config.render_mode.set(mode)
+        await self.config.render_workers.set(workers)
+        self.render_pool.configure(mode, workers)
+        await ctx.send(f"Charts are now rendered by {workers} {mode} workers.")
+
     @commands.command(name="crowns")
     @commands.check(tokencheck)
     @commands.guild_only()
@@ -316,27 +595,19 @@ class LastFM(
     async def command_streak(self, ctx, user: discord.User = None):
         """
         View how many times you've listened to something in a row
-
-        Only the most 200 recent plays are tracked
         """
         if not user:
             user = ctx.author
         conf = await self.config.user(user).all()
         self.check_if_logged_in(conf, user == ctx.author)
-        data = await self.api_request(
-            ctx,
-            {"user": conf["lastfm_username"], "method": "user.getrecenttracks", "limit": 200},
-        )
-        tracks = data["recenttracks"]["track"]
-        if not tracks or not isinstance(tracks, list):
-            return await ctx.send("You have not listened to anything yet!")
-        track_streak = [tracks[0]["name"], 1, True]
-        artist_streak = [tracks[0]["artist"]["#text"], 1, True]
-        album_streak = [tracks[0]["album"]["#text"], 1, True]
-        ignore = True
-        for x in tracks:
-            if ignore:
-                ignore = False
+        tracks = self.iter_recent_tracks(ctx, conf["lastfm_username"], prefetch=1)
+        first = None
+        async for x in tracks:
+            if first is None:
+                first = x
+                track_streak = [x["name"], 1, True]
+                artist_streak = [x["artist"]["#text"], 1, True]
+                album_streak = [x["album"]["#text"], 1, True]
                 continue
             if track_streak[2]:
                 if x["name"] == track_streak[0]:
@@ -356,11 +627,14 @@ class LastFM(
 
             if not track_streak[2] and not artist_streak[2] and not album_streak[2]:
                 break
+        await tracks.aclose()
 
+        if first is None:
+            return await ctx.send("You have not listened to anything yet!")
         if track_streak[1] == 1 and artist_streak[1] == 1 and album_streak[1] == 1:
             return await ctx.send("You have not listened to anything in a row.")
         embed = discord.Embed(color=await ctx.embed_color(), title=f"{user.name}'s streaks")
-        embed.set_thumbnail(url=tracks[0]["image"][3]["#text"])
+        embed.set_thumbnail(url=first["image"][3]["#text"])
         if track_streak[1] > 1:
             embed.add_field(
                 name="Track", value=f"{track_streak[1]} times in a row \n({track_streak[0][:50]})"
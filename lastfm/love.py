@@ -12,7 +12,7 @@ command_fm_server = FMMixin.command_fm_server
 class LoveMixin(MixinMeta):
     """Love Commands"""
 
-    async def love_or_unlove_song(self, track, artist, love, key):
+    async def love_or_unlove_song(self, track, artist, love, key, username):
         params = {
             "api_key": self.token,
             "artist": artist,
@@ -24,6 +24,9 @@ class LoveMixin(MixinMeta):
         else:
             params["method"] = "track.unlove"
         data = await self.api_post(params=params)
+        if data and data[0] == 200:
+            # loved tracks and the heart in fm np would be stale otherwise
+            self.api_cache.invalidate_user(username, ("user.getlovedtracks", "track.getinfo"))
         return data
 
     @command_fm.command(name="love", usage="<track name> | <artist name>")
@@ -57,6 +60,7 @@ class LoveMixin(MixinMeta):
                 "track": trackname,
                 "artist": artistname,
             },
+            cache=False,
         )
 
         if data["track"].get("userloved", "0") == "1":
@@ -65,7 +69,11 @@ class LoveMixin(MixinMeta):
             )
 
         result = await self.love_or_unlove_song(
-            data["track"]["name"], data["track"]["artist"]["name"], True, conf["session_key"]
+            data["track"]["name"],
+            data["track"]["artist"]["name"],
+            True,
+            conf["session_key"],
+            conf["lastfm_username"],
         )
         await self.maybe_send_403_msg(ctx, result)
         await ctx.send(f"Loved **{trackname[:50]}** by **{artistname[:50]}**")
@@ -101,6 +109,7 @@ class LoveMixin(MixinMeta):
                 "track": trackname,
                 "artist": artistname,
             },
+            cache=False,
         )
 
         if data["track"].get("userloved", "0") == "0":
@@ -109,7 +118,11 @@ class LoveMixin(MixinMeta):
             )
 
         result = await self.love_or_unlove_song(
-            data["track"]["name"], data["track"]["artist"]["name"], False, conf["session_key"]
+            data["track"]["name"],
+            data["track"]["artist"]["name"],
+            False,
+            conf["session_key"],
+            conf["lastfm_username"],
         )
         await self.maybe_send_403_msg(ctx, result)
         await ctx.send(f"Unloved **{trackname[:50]}** by **{artistname[:50]}**")
@@ -8,6 +8,7 @@ from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 from .abc import MixinMeta
 from .exceptions import *
 from .fmmixin import FMMixin
+from .utils.ratelimit import BULK
 
 command_fm = FMMixin.command_fm
 command_fm_server = FMMixin.command_fm_server
@@ -126,7 +127,9 @@ class NowPlayingMixin(MixinMeta):
                 if member is None:
                     continue
 
-                tasks.append(self.get_current_track(ctx, lastfm_username, member, True))
+                tasks.append(
+                    self.get_current_track(ctx, lastfm_username, member, True, priority=BULK)
+                )
 
             total_linked = len(tasks)
             if tasks:
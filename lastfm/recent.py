@@ -22,13 +22,17 @@ class RecentMixin(MixinMeta):
         name = conf["lastfm_username"]
         self.check_if_logged_in(conf)
         async with ctx.typing():
-            data = await self.api_request(
-                ctx, {"user": name, "method": "user.getrecenttracks", "limit": size}
-            )
-            user_attr = data["recenttracks"]["@attr"]
-            tracks = data["recenttracks"]["track"]
+            user_attr = None
+            tracks = []
+            pages = self.iter_recent_pages(ctx, name, limit=min(size, 200))
+            async for page in pages:
+                user_attr = user_attr or page["@attr"]
+                tracks += page["track"] if isinstance(page["track"], list) else [page["track"]]
+                if len(tracks) >= size:
+                    break
+            await pages.aclose()
 
-            if not tracks or not isinstance(tracks, list):
+            if not tracks:
                 return await ctx.send("You have not listened to anything yet!")
 
             rows = []
@@ -84,7 +88,7 @@ class RecentMixin(MixinMeta):
             data = await asyncio.gather(*tasks)
             for song, member_ref in data:
                 if song is not None:
-                    if song.get("nowplaying"):
+                    if song.nowplaying:
                         total_listening += 1
                     listeners.append((song, member_ref))
         else:
@@ -93,16 +97,16 @@ class RecentMixin(MixinMeta):
         if not listeners:
             return await ctx.send("Nobody on this server is listening to anything at the moment!")
 
-        listeners = sorted(listeners, key=lambda l: l[0].get("date"), reverse=True)
+        listeners = sorted(listeners, key=lambda l: l[0].timestamp, reverse=True)
         rows = []
         for song, member in listeners:
             suffix = ""
-            if song.get("nowplaying"):
+            if song.nowplaying:
                 suffix = ":musical_note: "
             else:
-                suffix = f"(<t:{song.get('date')}:R>)"
+                suffix = f"(<t:{song.timestamp}:R>)"
             rows.append(
-                f"{member.mention} [**{escape(song.get('artist'), formatting=True)}** — **{escape(song.get('name'), formatting=True)}**]({song.get('url')}) {suffix}"
+                f"{member.mention} [**{escape(song.artist, formatting=True)}** — **{escape(song.name, formatting=True)}**]({song.url}) {suffix}"
             )
 
         content = discord.Embed(color=await ctx.embed_color())
@@ -205,8 +205,8 @@ class TopMixin(MixinMeta):
                     continue
                 total_users += 1
                 for user_data in user:
-                    artist_name = user_data["name"]
-                    artist_plays = int(user_data["playcount"])
+                    artist_name = user_data.name
+                    artist_plays = user_data.playcount
                     total_plays += artist_plays
                     if artist_name in mapping:
                         mapping[artist_name] += artist_plays
@@ -269,8 +269,8 @@ class TopMixin(MixinMeta):
                     continue
                 total_users += 1
                 for user_data in user:
-                    name = f'**{escape(user_data["artist"]["name"], formatting=True)}** — **{escape(user_data["name"], formatting=True)}**'
-                    plays = int(user_data["playcount"])
+                    name = f"**{escape(user_data.artist, formatting=True)}** — **{escape(user_data.name, formatting=True)}**"
+                    plays = user_data.playcount
                     total_plays += plays
                     if name in mapping:
                         mapping[name] += plays
@@ -332,8 +332,8 @@ class TopMixin(MixinMeta):
                     continue
                 total_users += 1
                 for user_data in user:
-                    name = f'**{escape(user_data["artist"]["name"], formatting=True)}** — **{escape(user_data["name"], formatting=True)}**'
-                    plays = int(user_data["playcount"])
+                    name = f"**{escape(user_data.artist, formatting=True)}** — **{escape(user_data.name, formatting=True)}**"
+                    plays = user_data.playcount
                     total_plays += plays
                     if name in mapping:
                         mapping[name] += plays
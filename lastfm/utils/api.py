@@ -1,36 +1,134 @@
+import asyncio
+import codecs
 import contextlib
+from collections import deque
 
 import aiohttp
 import arrow
 
 from ..exceptions import *
+from .cache import is_shareable, make_key
+from .http import API_URL
+from .metadata import PERSISTENT_TTLS, store_key
+from .models import MODELS, Scrobble
+from .ratelimit import BULK, INTERACTIVE
+from .retry import RETRYABLE_ERROR_CODES, RETRYABLE_EXCEPTIONS, RETRYABLE_STATUSES
 
 
 class APIMixin:
-    async def api_request(self, ctx, params, supress_errors=False):
+    async def api_request(
+        self, ctx, params, supress_errors=False, cache=True, priority=INTERACTIVE
+    ):
         """Get json data from the lastfm api"""
-        url = "http://ws.audioscrobbler.com/2.0/"
-        params["api_key"] = self.token
-        params["format"] = "json"
-        async with self.session.get(url, params=params) as response:
-            with contextlib.suppress(aiohttp.ContentTypeError):
-                content = await response.json()
-                if "error" in content or response.status != 200:
-                    if supress_errors:
-                        return
-                    raise LastFMError(
-                        f"Last.fm returned an error: {content.get('message')} | Error code {content.get('error')}"
+        ttl = self.api_cache.ttl_for(params) if cache else None
+        key = make_key(params)
+        if ttl:
+            content = self.api_cache.get(key)
+            if content is not None:
+                return content
+        try:
+            if not is_shareable(params):
+                return await self._api_get(params, key, ttl, priority)
+            # Identical requests already in flight share a single http request.
+            return await self._inflight_requests.run(
+                key, lambda: self._api_get(params, key, ttl, priority)
+            )
+        except LastFMError:
+            if supress_errors:
+                return
+            raise
+
+    async def _api_get(self, params, key, ttl, priority):
+        persistent_key = store_key(params) if ttl and self.metadata_store else None
+        if persistent_key:
+            entry = await self.metadata_store.get(persistent_key)
+            if entry is not None:
+                content, size = entry
+                self.api_cache.set(key, content, size, ttl)
+                return content
+
+        policy = self.api_retry
+        for attempt in range(policy.attempts):
+            if not self.api_breaker.allow():
+                return await self._api_unavailable(key, persistent_key)
+            # while the circuit is open only the probe request gets through
+            probe = self.api_breaker.is_open
+            try:
+                content = await self._api_get_once(params, key, ttl, priority)
+            except LastFMUnavailableError as e:
+                self.api_breaker.record_failure()
+                error = e
+            except LastFMError:
+                # any other error is still a real reply from last.fm
+                self.api_breaker.record_success()
+                raise
+            else:
+                self.api_breaker.record_success()
+                if persistent_key and content is not None:
+                    asyncio.ensure_future(
+                        self.metadata_store.set(
+                            persistent_key, content, PERSISTENT_TTLS[params["method"].lower()]
+                        )
                     )
                 return content
+            finally:
+                # a cancelled or crashed probe must not keep the circuit open
+                if probe:
+                    self.api_breaker.release_probe()
+            if attempt + 1 == policy.attempts:
+                return await self._api_unavailable(key, persistent_key, error)
+            await policy.sleep(attempt, error.code)
+
+    async def _api_unavailable(self, key, persistent_key=None, error=None):
+        """Serve stale cached data while last.fm is having issues."""
+        content = self.api_cache.get_stale(key)
+        if content is not None:
+            return content
+        if persistent_key:
+            entry = await self.metadata_store.get(persistent_key, stale=True)
+            if entry is not None:
+                return entry[0]
+        if error is not None:
+            raise error
+        raise LastFMUnavailableError(
+            "Last.fm appears to be having issues right now, please try again later."
+        )
+
+    async def _api_get_once(self, params, key, ttl, priority):
+        params = dict(params, api_key=self.token, format="json")
+        try:
+            async with self.api_limiter.acquire(priority), self.api_session.get(
+                API_URL, params=params
+            ) as response:
+                if response.status in RETRYABLE_STATUSES:
+                    raise LastFMUnavailableError(
+                        f"Last.fm returned an error: HTTP {response.status}"
+                    )
+                with contextlib.suppress(aiohttp.ContentTypeError):
+                    content = await response.json()
+                    if "error" in content or response.status != 200:
+                        message = (
+                            f"Last.fm returned an error: {content.get('message')} "
+                            f"| Error code {content.get('error')}"
+                        )
+                        if content.get("error") in RETRYABLE_ERROR_CODES:
+                            raise LastFMUnavailableError(message, code=content.get("error"))
+                        raise LastFMError(message, code=content.get("error"))
+                    if ttl:
+                        self.api_cache.set(key, content, len(await response.read()), ttl)
+                    return content
+        except RETRYABLE_EXCEPTIONS as e:
+            raise LastFMUnavailableError(
+                "Could not connect to Last.fm, please try again later."
+            ) from e
 
     async def api_post(self, params):
         """Post data to the lastfm api"""
-        url = "http://ws.audioscrobbler.com/2.0/"
         params["api_key"] = self.token
         hashed = self.hashRequest(params, self.secret)
         params["api_sig"] = hashed
         params["format"] = "json"
-        async with self.session.post(url, params=params) as response:
+        async with self.api_session.post(API_URL, params=params) as response:
             with contextlib.suppress(aiohttp.ContentTypeError):
                 content = await response.json()
                 return response.status, content
@@ -39,17 +137,128 @@ class APIMixin:
         if params is None:
             params = {}
         cookies = {'sessionid': self.login_token}
-        async with self.session.get(url, params=params, cookies=cookies) as response:
+        policy = self.scrape_retry
+        for attempt in range(policy.attempts):
+            last_attempt = attempt + 1 == policy.attempts
+            try:
+                async with self.session.get(url, params=params, cookies=cookies) as response:
+                    if response.status in RETRYABLE_STATUSES and not last_attempt:
+                        await policy.sleep(attempt)
+                        continue
 
-            if handling == "json":
-                return await response.json()
-            if handling == "text":
-                return await response.text()
-            return await response
+                    if handling == "json":
+                        return await response.json()
+                    if handling == "text":
+                        return await response.text()
+                    return await response
+            except RETRYABLE_EXCEPTIONS:
+                if last_attempt:
+                    raise
+                await policy.sleep(attempt)
 
-    async def get_current_track(self, ctx, username, ref=None, supress_errors=False):
+    async def fetch_until(
+        self, ctx, url, parser, params=None, chunk_size=8192, drain_limit=256 * 1024
+    ):
+        """
+        Stream a page into an incremental parser until it has what it needs.
+
+        `parser` is called for a fresh parser on every attempt. Once the parser is
+        `done` the rest of the body is read and thrown away, up to `drain_limit`
+        bytes, so the connection goes back to the pool. Leaving a body unread makes
+        aiohttp close the connection and the next scrape pays for a new TLS
+        handshake, which costs more than the remaining ~75KB of a library page.
+        """
+        cookies = {"sessionid": self.login_token}
+        policy = self.scrape_retry
+        for attempt in range(policy.attempts):
+            last_attempt = attempt + 1 == policy.attempts
+            try:
+                async with self.session.get(url, params=params, cookies=cookies) as response:
+                    if response.status in RETRYABLE_STATUSES and not last_attempt:
+                        await policy.sleep(attempt)
+                        continue
+                    page = parser()
+                    decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(
+                        errors="replace"
+                    )
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        page.feed(decoder.decode(chunk))
+                        if page.done:
+                            break
+                    else:
+                        page.feed(decoder.decode(b"", final=True))
+                    drained = 0
+                    while drained < drain_limit:
+                        chunk = await response.content.readany()
+                        if not chunk:
+                            break
+                        drained += len(chunk)
+                    return page.result
+            except RETRYABLE_EXCEPTIONS:
+                if last_attempt:
+                    raise
+                await policy.sleep(attempt)
+
+    async def iter_recent_pages(
+        self, ctx, username, from_ts=None, to_ts=None, limit=200, prefetch=3
+    ):
+        """
+        Yield every page of a user's recent tracks between `from_ts` and `to_ts`.
+
+        The first page tells us how many pages there are, after which up to
+        `prefetch` of the following pages are requested ahead of time.
+        """
+        params = {"method": "user.getrecenttracks", "user": username, "limit": limit}
+        if from_ts is not None:
+            params["from"] = from_ts
+        if to_ts is not None:
+            params["to"] = to_ts
+        page = (await self.api_request(ctx, dict(params, page=1)))["recenttracks"]
+        total_pages = int(page["@attr"]["totalPages"])
+        pending = deque()
+        next_page = 2
+        try:
+            while True:
+                while len(pending) < prefetch and next_page <= total_pages:
+                    pending.append(
+                        asyncio.ensure_future(
+                            self.api_request(ctx, dict(params, page=next_page), priority=BULK)
+                        )
+                    )
+                    next_page += 1
+                yield page
+                if not pending:
+                    return
+                page = (await pending.popleft())["recenttracks"]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def iter_recent_tracks(
+        self, ctx, username, from_ts=None, to_ts=None, nowplaying=True, **kwargs
+    ):
+        """Yield a user's recent tracks one by one, newest first."""
+        pages = self.iter_recent_pages(ctx, username, from_ts, to_ts, **kwargs)
+        try:
+            async for page in pages:
+                tracks = page["track"]
+                if isinstance(tracks, dict):
+                    tracks = [tracks]
+                for track in tracks:
+                    if not nowplaying and track.get("@attr", {}).get("nowplaying"):
+                        continue
+                    yield track
+        finally:
+            await pages.aclose()
+
+    async def get_current_track(
+        self, ctx, username, ref=None, supress_errors=False, priority=INTERACTIVE
+    ):
         data = await self.api_request(
-            ctx, {"method": "user.getrecenttracks", "user": username, "limit": 1}, supress_errors
+            ctx,
+            {"method": "user.getrecenttracks", "user": username, "limit": 1},
+            supress_errors,
+            priority=priority,
         )
         if not data:
             return
@@ -85,48 +294,31 @@ class APIMixin:
             return None, None, None, None, ref
 
     async def get_server_top(self, ctx, username, request_type, period, limit=100):
-        if request_type == "artist":
-            data = await self.api_request(
-                ctx,
-                {
-                    "user": username,
-                    "method": "user.gettopartists",
-                    "limit": limit,
-                    "period": period,
-                },
-                True,
-            )
-            return data["topartists"]["artist"] if data is not None else None
-        if request_type == "album":
-            data = await self.api_request(
-                ctx,
-                {
-                    "user": username,
-                    "method": "user.gettopalbums",
-                    "limit": limit,
-                    "period": period,
-                },
-                True,
-            )
-            return data["topalbums"]["album"] if data is not None else None
-        if request_type == "track":
-            data = await self.api_request(
-                ctx,
-                {
-                    "user": username,
-                    "method": "user.gettoptracks",
-                    "limit": limit,
-                    "period": period,
-                },
-                True,
-            )
-            return data["toptracks"]["track"] if data is not None else None
+        data = await self.api_request(
+            ctx,
+            {
+                "user": username,
+                "method": f"user.gettop{request_type}s",
+                "limit": limit,
+                "period": period,
+            },
+            True,
+            priority=BULK,
+        )
+        if data is None:
+            return None
+        items = data[f"top{request_type}s"][request_type]
+        if isinstance(items, dict):
+            items = [items]
+        model = MODELS[request_type]
+        return [model.from_json(item) for item in items]
 
     async def get_lastplayed(self, ctx, username, ref):
         data = await self.api_request(
             ctx,
             {"method": "user.getrecenttracks", "user": username, "limit": 1},
             True,
+            priority=BULK,
         )
         song = None
         if data:
@@ -139,21 +331,8 @@ class APIMixin:
             else:
                 track = tracks
 
-            nowplaying = False
-            if track.get("@attr") and track["@attr"].get("nowplaying"):
-                nowplaying = True
-
-            if track.get("date"):
-                date = tracks[0]["date"]["uts"]
-            else:
-                date = arrow.utcnow().int_timestamp
-
-            song = {
-                "name": track["name"],
-                "artist": track["artist"]["#text"],
-                "nowplaying": nowplaying,
-                "date": int(date),
-                "url": track["url"],
-            }
+            song = Scrobble.from_json(track)
+            if song.timestamp is None:
+                song.timestamp = arrow.utcnow().int_timestamp
 
         return song, ref
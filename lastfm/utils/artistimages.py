@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from .singleflight import SingleFlight
+
+
+def _store_key(name):
+    return f"artist={name.lower()}&method=artist.image"
+
+
+class ArtistImageIndex:
+    """
+    Artist name to image url index, so artist images are only scraped once in a while.
+
+    Entries live in memory and, once a store is attached, in the metadata store so
+    they survive restarts. Entries older than `refresh_after` are still served but
+    scraped again in the background, entries older than `ttl` are scraped again
+    before returning.
+
+    A scrape that found no image may just have hit an error page, so it is only
+    remembered in memory and for `missing_ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        store=None,
+        ttl=30 * 86400,
+        refresh_after=7 * 86400,
+        missing_ttl=600,
+        max_entries=20000,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.refresh_after = refresh_after
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._entries = OrderedDict()
+        self._scrapes = SingleFlight()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, url, fetched):
+        self._entries[key] = (url, fetched)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        if self.store is None:
+            return None
+        stored = await self.store.get(_store_key(key))
+        if stored is None:
+            return None
+        value, _ = stored
+        entry = (value["image"], value["fetched"])
+        self._remember(key, *entry)
+        return entry
+
+    async def lookup(self, name, scrape):
+        """
+        Get the image url of an artist.
+
+        `scrape` is called with the artist name to get the url from last.fm when the
+        index doesn't have a fresh enough one.
+        """
+        key = name.lower()
+        entry = await self._load(key)
+        if entry is None or time.time() - entry[1] > (self.ttl if entry[0] else self.missing_ttl):
+            self.misses += 1
+            return await asyncio.shield(self._refresh(key, name, scrape))
+        self.hits += 1
+        if time.time() - entry[1] > self.refresh_after:
+            self.refreshes += 1
+            self._refresh(key, name, scrape)
+        return entry[0]
+
+    def _refresh(self, key, name, scrape):
+        # concurrent lookups of the same artist share one scrape
+        return self._scrapes.start(key, lambda: self._scrape(name, scrape))
+
+    async def _scrape(self, name, scrape):
+        url = await scrape(name)
+        if url:
+            await self.update([(name, url)])
+        else:
+            self._remember(name.lower(), url, time.time())
+        return url
+
+    async def update(self, images):
+        """Add (artist name, image url) pairs scraped elsewhere to the index."""
+        now = time.time()
+        entries = []
+        for name, url in images:
+            if not url:
+                continue
+            self._remember(name.lower(), url, now)
+            entries.append((_store_key(name), {"image": url, "fetched": now}))
+        if self.store is not None and entries:
+            await self.store.set_many(entries, self.ttl)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+        }
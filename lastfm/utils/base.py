@@ -6,13 +6,13 @@ from copy import deepcopy
 import arrow
 import discord
 import tabulate
-from bs4 import BeautifulSoup
 from redbot.core.utils.chat_formatting import box
 
 from ..abc import *
 from ..exceptions import *
 from .api import APIMixin
 from .converters import ConvertersMixin
+from .ratelimit import BULK, INTERACTIVE
 from .scraping import ScrapingMixin
 
 
@@ -25,55 +25,27 @@ class UtilsMixin(APIMixin, ConvertersMixin, ScrapingMixin):
 
     async def artist_overview(self, ctx, period, artistname, fmname):
         """Overall artist view"""
-        albums = []
-        tracks = []
-        metadata = [None, None, None]
-        artistinfo = await self.api_request(
-            ctx, {"method": "artist.getInfo", "artist": artistname}
-        )
-        url = (
-            f"https://last.fm/user/{fmname}/library/music/{artistname}"
-            f"?date_preset={self.period_http_format(period)}"
-        )
-        data = await self.fetch(ctx, url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
-        try:
-            albumsdiv, tracksdiv, _ = soup.findAll("tbody", {"data-playlisting-add-entries": ""})
-        except ValueError:
+        library = await self.library_artist(ctx, fmname, artistname, period)
+        artistinfo = library["info"]
+        overview = library["overview"]
+        if overview is None:
             if period == "overall":
                 return await ctx.send(f"You have never listened to **{artistname}**!")
             return await ctx.send(
                 f"You have not listened to **{artistname}** in the past {period}s!"
             )
-
-        for container, destination in zip([albumsdiv, tracksdiv], [albums, tracks]):
-            items = container.findAll("tr", {"class": "chartlist-row"})
-            for item in items:
-                name = item.find("td", {"class": "chartlist-name"}).find("a").get("title")
-                playcount = (
-                    item.find("span", {"class": "chartlist-count-bar-value"})
-                    .text.replace("scrobbles", "")
-                    .replace("scrobble", "")
-                    .strip()
-                )
-                destination.append((name, playcount))
-
-        metadata_list = soup.find("ul", {"class": "metadata-list"})
-        for i, metadata_item in enumerate(
-            metadata_list.findAll("p", {"class": "metadata-display"})
-        ):
-            metadata[i] = int(metadata_item.text.replace(",", ""))
-
+        albums = overview["albums"]
+        tracks = overview["tracks"]
+        metadata = overview["metadata"]
         artist = {
-            "image_url": soup.find("span", {"class": "library-header-image"})
-            .find("img")
-            .get("src")
-            .replace("avatar70s", "avatar300s"),
-            "formatted_name": soup.find("h2", {"class": "library-header-title"}).text.strip(),
+            "image_url": overview["image_url"],
+            "formatted_name": overview["formatted_name"],
         }
 
-        similar = [a["name"] for a in artistinfo["artist"]["similar"]["artist"]]
-        tags = [t["name"] for t in artistinfo["artist"]["tags"]["tag"]]
+        similar, tags = [], []
+        if artistinfo:
+            similar = [a["name"] for a in artistinfo["artist"]["similar"]["artist"]]
+            tags = [t["name"] for t in artistinfo["artist"]["tags"]["tag"]]
 
         content = discord.Embed(color=await self.bot.get_embed_color(ctx.channel))
         content.set_thumbnail(url=artist["image_url"])
@@ -168,32 +140,29 @@ class UtilsMixin(APIMixin, ConvertersMixin, ScrapingMixin):
                 }
             )
 
-        params = {
-            "method": "user.getrecenttracks",
-            "user": name,
-            "from": week[-1]["ts"],
-            "to": int(current_day_floor.shift(minutes=-1).timestamp()),
-            "limit": 1000,
-        }
-        content = await self.api_request(ctx, params)
-        tracks = content["recenttracks"]["track"]
-        if not tracks or not isinstance(tracks, list):
+        # nowplaying track is skipped as it appears even with from and to parameters
+        tracks = self.iter_recent_tracks(
+            ctx,
+            name,
+            from_ts=week[-1]["ts"],
+            to_ts=int(current_day_floor.shift(minutes=-1).timestamp()),
+            nowplaying=False,
+        )
+        found = False
+        async for trackdata in tracks:
+            found = True
+            # a scrobble at exactly midnight belongs to the day starting then,
+            # week[i] covers [floor - (i + 1) days, floor - i days)
+            days_ago = (
+                current_day_floor.int_timestamp - int(trackdata["date"]["uts"]) - 1
+            ) // 86400
+            if 0 <= days_ago < len(week):
+                week[days_ago]["scrobbles"] += 1
+
+        if not found:
             await ctx.send("No data found.")
             return
 
-        # get rid of nowplaying track if user is currently scrobbling.
-        # for some reason even with from and to parameters it appears
-        if tracks[0].get("@attr") is not None:
-            tracks = tracks[1:]
-
-        day_counter = 1
-        for trackdata in reversed(tracks):
-            scrobble_ts = int(trackdata["date"]["uts"])
-            if scrobble_ts > week[-day_counter]["ts_to"]:
-                day_counter += 1
-
-            week[day_counter - 1]["scrobbles"] += 1
-
         scrobbles_total = sum(day["scrobbles"] for day in week)
         scrobbles_average = round(scrobbles_total / len(week))
 
@@ -293,28 +262,56 @@ class UtilsMixin(APIMixin, ConvertersMixin, ScrapingMixin):
             await ctx.send(embed=embed)
             raise SilentDeAuthorizedError
 
+    def negative_cache_keys(self, params):
+        entity = tuple(str(params[k]).lower() for k in ("artist", "album", "track") if k in params)
+        not_found = (params["method"], *entity)
+        return not_found, (*not_found, params["user"].lower())
+
+    async def playcount_request(self, ctx, params, reference=None):
+        """Request play count info, skipping lookups that recently found nothing."""
+        not_found_key, no_plays_key = self.negative_cache_keys(params)
+        for key in (not_found_key, no_plays_key):
+            data = self.negative_cache.get(key)
+            if data is not None:
+                return data
+        try:
+            return await self.api_request(
+                ctx,
+                params,
+                # a reference is only passed when fanning out over a guild
+                priority=BULK if reference is not None else INTERACTIVE,
+            )
+        except LastFMUnavailableError:
+            return {}
+        except LastFMError as e:
+            # only "not found" says anything about the entity itself, other errors
+            # may be specific to this user or to our api key
+            if e.code == 6:
+                self.negative_cache.set(not_found_key, {})
+            return {}
+
+    def remember_no_plays(self, params, data, count):
+        if data and count == 0:
+            self.negative_cache.set(self.negative_cache_keys(params)[1], data)
+
     async def get_playcount_track(self, ctx, username, artist, track, period, reference=None):
         if period != "overall":
             return await self.get_playcount_track_scraper(ctx, username, artist, track, period)
 
-        try:
-            data = await self.api_request(
-                ctx,
-                {
-                    "method": "track.getinfo",
-                    "user": username,
-                    "track": track,
-                    "artist": artist,
-                    "autocorrect": 1,
-                },
-            )
-        except LastFMError:
-            data = {}
+        params = {
+            "method": "track.getinfo",
+            "user": username,
+            "track": track,
+            "artist": artist,
+            "autocorrect": 1,
+        }
+        data = await self.playcount_request(ctx, params, reference)
 
         try:
             count = int(data["track"]["userplaycount"])
         except KeyError:
             count = 0
+        self.remember_no_plays(params, data, count)
         try:
             artistname = data["track"]["artist"]["name"]
             trackname = data["track"]["name"]
@@ -335,23 +332,19 @@ class UtilsMixin(APIMixin, ConvertersMixin, ScrapingMixin):
     async def get_playcount_album(self, ctx, username, artist, album, period, reference=None):
         if period != "overall":
             return await self.get_playcount_album_scraper(ctx, username, artist, album, period)
-        try:
-            data = await self.api_request(
-                ctx,
-                {
-                    "method": "album.getinfo",
-                    "user": username,
-                    "album": album,
-                    "artist": artist,
-                    "autocorrect": 1,
-                },
-            )
-        except LastFMError:
-            data = {}
+        params = {
+            "method": "album.getinfo",
+            "user": username,
+            "album": album,
+            "artist": artist,
+            "autocorrect": 1,
+        }
+        data = await self.playcount_request(ctx, params, reference)
         try:
             count = int(data["album"]["userplaycount"])
         except (KeyError, TypeError):
             count = 0
+        self.remember_no_plays(params, data, count)
 
         try:
             artistname = data["album"]["artist"]
@@ -374,24 +367,20 @@ class UtilsMixin(APIMixin, ConvertersMixin, ScrapingMixin):
         if period != "overall":
             return await self.get_playcount_scraper(ctx, username, artist, period)
 
-        try:
-            data = await self.api_request(
-                ctx,
-                {
-                    "method": "artist.getinfo",
-                    "user": username,
-                    "artist": artist,
-                    "autocorrect": 1,
-                },
-            )
-        except LastFMError:
-            data = {}
+        params = {
+            "method": "artist.getinfo",
+            "user": username,
+            "artist": artist,
+            "autocorrect": 1,
+        }
+        data = await self.playcount_request(ctx, params, reference)
         try:
             count = int(data["artist"]["stats"]["userplaycount"])
             name = data["artist"]["name"]
         except (KeyError, TypeError):
             count = 0
             name = None
+        self.remember_no_plays(params, data, count)
 
         if not reference:
             return count
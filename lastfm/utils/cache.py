@@ -0,0 +1,175 @@
+import time
+from collections import OrderedDict
+
+# Seconds a successful response for a given api method stays fresh.
+# Methods not listed here are never cached (auth, scrobbling, etc).
+DEFAULT_TTLS = {
+    "user.getrecenttracks": 15,
+    "user.getinfo": 300,
+    "user.gettopartists": 600,
+    "user.gettopalbums": 600,
+    "user.gettoptracks": 600,
+    "user.getlovedtracks": 300,
+    "artist.getinfo": 86400,
+    "album.getinfo": 3600,
+    "track.getinfo": 300,
+}
+
+# Info requests for a user include their play count, which changes a lot more
+# often than the rest of the metadata.
+USER_TTLS = {
+    "artist.getinfo": 300,
+    "album.getinfo": 300,
+    "track.getinfo": 300,
+}
+
+IGNORED_PARAMS = ("api_key", "format", "api_sig")
+
+
+def make_key(params):
+    """Build a hashable cache key from api request params."""
+    return tuple(
+        sorted(
+            (k, str(v).lower() if k == "method" else str(v))
+            for k, v in params.items()
+            if k not in IGNORED_PARAMS
+        )
+    )
+
+
+def is_shareable(params):
+    """
+    Whether identical requests in flight may share a single response.
+
+    Only reads of public data qualify. Auth methods hand out a new token or
+    session on every call and signed requests act for one user.
+    """
+    method = str(params.get("method", "")).lower()
+    return method in DEFAULT_TTLS and "sk" not in params and "api_sig" not in params
+
+
+class ResponseCache:
+    """
+    In-memory LRU cache for api responses.
+
+    Entries expire per api method and the cache evicts the least recently used
+    entries once the total size of the stored payloads goes over `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttls=None):
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self._entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def ttl_for(self, params):
+        method = str(params.get("method", "")).lower()
+        if "user" in params or "username" in params:
+            return USER_TTLS.get(method, self.ttls.get(method))
+        return self.ttls.get(method)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        content, size, expires = entry
+        if expires < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def get_stale(self, key):
+        """Get an entry even if it expired, for when the api is unavailable."""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key, content, size, ttl):
+        if size > self.max_bytes:
+            return
+        self.pop(key)
+        self._entries[key] = (content, size, time.monotonic() + ttl)
+        self.size += size
+        self._evict()
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            _, (_, old_size, _) = self._entries.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def invalidate_user(self, username, methods):
+        """Drop the cached responses of `methods` requested for `username`."""
+        username = username.lower()
+        for key in list(self._entries):
+            params = dict(key)
+            user = params.get("user", params.get("username"))
+            if params.get("method") in methods and user and user.lower() == username:
+                self.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class NegativeCache:
+    """
+    Short lived cache of "not found" and "no plays" lookups.
+
+    Values are the metadata that came with the empty result, so a hit can be
+    answered exactly like the original request was.
+    """
+
+    def __init__(self, ttl=600, max_entries=50000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
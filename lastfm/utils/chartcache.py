@@ -0,0 +1,142 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import ResponseCache
+
+
+def chart_key(*parts):
+    """Key for a chart, `parts` should include everything drawn on it."""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class ChartCache:
+    """
+    Cache of finished chart files.
+
+    Charts are kept in memory up to `max_bytes` and, once a directory is attached
+    with `max_disk_bytes` above zero, written there too so they outlive evictions
+    and restarts. Both tiers drop the least recently used charts first.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=86400):
+        self.ttl = ttl
+        self.memory = ResponseCache(max_bytes=max_bytes, ttls={})
+        self.path = None
+        self.max_disk_bytes = 0
+        self.disk_size = 0
+        self.disk_hits = 0
+        self._files = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lastfm-charts")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def configure(self, max_bytes, path=None, max_disk_bytes=0):
+        self.memory.resize(max_bytes)
+        self.path = path if max_disk_bytes else None
+        self.max_disk_bytes = max_disk_bytes
+        await self._run(self._scan, path)
+
+    def _scan(self, path):
+        self._files.clear()
+        self.disk_size = 0
+        if path is None:
+            return
+        if self.path is not None:
+            os.makedirs(path, exist_ok=True)
+        elif not os.path.isdir(path):
+            return
+        files = []
+        for entry in os.scandir(path):
+            if entry.name.endswith(".webp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        if self.path is None:
+            # the disk tier was turned off, don't leave its charts behind
+            for _, key, _ in files:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(path, f"{key}.webp"))
+            return
+        for _, key, size in sorted(files):
+            self._files[key] = size
+            self.disk_size += size
+        self._evict_disk()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.webp")
+
+    async def get(self, key):
+        data = self.memory.get(key)
+        if data is not None or key not in self._files:
+            return data
+        data = await self._run(self._read, key)
+        if data is not None:
+            self.disk_hits += 1
+            self.memory.set(key, data, len(data), self.ttl)
+        return data
+
+    def _read(self, key):
+        try:
+            if os.path.getmtime(self._file(key)) + self.ttl < time.time():
+                self._remove(key)
+                return None
+            with open(self._file(key), "rb") as file:
+                data = file.read()
+        except OSError:
+            self._forget(key)
+            return None
+        self._files.move_to_end(key)
+        return data
+
+    async def set(self, key, data):
+        self.memory.set(key, data, len(data), self.ttl)
+        if self.path is not None and len(data) <= self.max_disk_bytes:
+            await self._run(self._write, key, data)
+
+    def _write(self, key, data):
+        with open(self._file(key), "wb") as file:
+            file.write(data)
+        self._forget(key)
+        self._files[key] = len(data)
+        self.disk_size += len(data)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self.disk_size > self.max_disk_bytes and self._files:
+            self._remove(next(iter(self._files)))
+
+    def _remove(self, key):
+        self._forget(key)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def _forget(self, key):
+        size = self._files.pop(key, None)
+        if size is not None:
+            self.disk_size -= size
+
+    async def clear(self):
+        self.memory.clear()
+        await self._run(self._clear_disk)
+
+    def _clear_disk(self):
+        for key in list(self._files):
+            self._remove(key)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return dict(
+            self.memory.stats(),
+            disk_entries=len(self._files),
+            disk_bytes=self.disk_size,
+            disk_hits=self.disk_hits,
+        )
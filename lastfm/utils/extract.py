@@ -0,0 +1,322 @@
+"""
+Extractors for the last.fm and musixmatch pages the cog scrapes.
+
+Each page type has one extractor method that turns the raw html into plain
+python data. lxml is used when it is installed since it is a lot faster than
+building a full BeautifulSoup tree, otherwise BeautifulSoup is used.
+"""
+
+from contextlib import suppress
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+with suppress(Exception):
+    import lxml.etree
+    import lxml.html
+
+
+def _playcount(text):
+    return text.replace("scrobbles", "").replace("scrobble", "").strip()
+
+
+def _int(text):
+    return int(_playcount(text).replace(",", ""))
+
+
+def _first_int(text):
+    return int(text.split(" ")[0].replace(",", ""))
+
+
+def _xpath(node, path):
+    # plain strings, lxml's smart strings keep the whole tree alive
+    return node.xpath(path, smart_strings=False)
+
+
+def _text(node):
+    return "".join(_xpath(node, ".//text()"))
+
+
+def _cls(name):
+    """XPath predicate matching elements that have `name` as one of their classes."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def lyrics_from_text(text):
+    """Lyrics and title from the text of a musixmatch song page, (None, None) if it has none."""
+    lyrics = text.split('"body":"')[0]
+    songname = lyrics.split("|")[0]
+    lyrics = lyrics.split('","language"')[0]
+    try:
+        lyrics = lyrics.split("languages")[1]
+    except IndexError:
+        return None, None
+    lyrics = lyrics.split("Report")[0]
+    lyrics = lyrics.replace("\\n", "\n")
+    lyrics = lyrics.replace("\\", "")
+    lyrics = lyrics.replace("&amp;", "&")
+    lyrics = lyrics.replace("`", "'")
+    lyrics = lyrics.strip()
+    return lyrics, songname.strip()
+
+
+class SoupExtractors:
+    """Extractors built on BeautifulSoup's html.parser."""
+
+    name = "bs4"
+
+    def parse(self, html):
+        return BeautifulSoup(html, "html.parser")
+
+    def _header(self, soup):
+        return (
+            soup.find("span", {"class": "library-header-image"})
+            .find("img")
+            .get("src")
+            .replace("avatar70s", "avatar300s")
+        )
+
+    def _chartlist(self, container, convert):
+        items = []
+        for item in container.findAll("tr", {"class": "chartlist-row"}):
+            name = item.find("td", {"class": "chartlist-name"}).find("a").get("title")
+            playcount = item.find("span", {"class": "chartlist-count-bar-value"}).text
+            items.append((name, convert(playcount)))
+        return items
+
+    def library_overview(self, html):
+        """Artist overview in a user's library, None if they never listened to them."""
+        soup = self.parse(html)
+        try:
+            albumsdiv, tracksdiv, _ = soup.findAll("tbody", {"data-playlisting-add-entries": ""})
+        except ValueError:
+            return None
+        metadata = [None, None, None]
+        metadata_list = soup.find("ul", {"class": "metadata-list"})
+        for i, item in enumerate(metadata_list.findAll("p", {"class": "metadata-display"})):
+            metadata[i] = int(item.text.replace(",", ""))
+        return {
+            "albums": self._chartlist(albumsdiv, _playcount),
+            "tracks": self._chartlist(tracksdiv, _playcount),
+            "metadata": metadata,
+            "image_url": self._header(soup),
+            "formatted_name": soup.find("h2", {"class": "library-header-title"}).text.strip(),
+        }
+
+    def library_top(self, html):
+        """Top tracks or albums of an artist in a user's library."""
+        soup = self.parse(html)
+        chartlist = soup.find("tbody", {"data-playlisting-add-entries": ""})
+        if chartlist is None:
+            return None, []
+        artist = {
+            "image_url": self._header(soup),
+            "formatted_name": soup.find("a", {"class": "library-header-crumb"}).text.strip(),
+        }
+        return artist, self._chartlist(chartlist, _int)
+
+    def playcount(self, html):
+        """Play count shown at the top of a library page."""
+        div = self.parse(html).find(class_="metadata-display")
+        if div is None:
+            return 0
+        return _first_int(div.get_text())
+
+    def artist_image(self, html):
+        soup = self.parse(html)
+        image = soup.find("img", {"class": "image-list-image"})
+        if image is None:
+            try:
+                image = soup.find("li", {"class": "image-list-item-wrapper"}).find("a").find("img")
+            except AttributeError:
+                return ""
+        return image["src"].replace("/avatar170s/", "/300x300/") if image else ""
+
+    def chart_artists(self, html):
+        """Artist names and images of a page of a user's artist library."""
+        artists = []
+        for row in self.parse(html).findAll("tr", {"class": "chartlist-row"}):
+            name = row.find("td", {"class": "chartlist-name"}).find("a").get("title")
+            image = row.find("td", {"class": "chartlist-image"}).find("img")["src"]
+            artists.append((name, image.replace("/avatar70s/", "/300x300/")))
+        return artists
+
+    def similar_artists(self, html):
+        soup = self.parse(html)
+        similar = [
+            artist.find("a").text
+            for artist in soup.findAll("h3", {"class": "artist-similar-artists-sidebar-item-name"})
+        ]
+        listeners = (
+            soup.find("li", {"class": "header-metadata-tnew-item--listeners"}).find("abbr").text
+        )
+        return similar, listeners
+
+    def lyrics_search(self, html):
+        """Path of the first song in musixmatch search results."""
+        songurl = self.parse(html).find("a", {"class": "title"})
+        return songurl["href"] if songurl is not None else None
+
+    def page_text(self, html):
+        return self.parse(html).text
+
+
+class LxmlExtractors(SoupExtractors):
+    """Extractors that only query the nodes they need from an lxml tree."""
+
+    name = "lxml"
+
+    def parse(self, html):
+        # lxml refuses empty documents, html.parser doesn't
+        return lxml.html.fromstring(html if html.strip() else "<html></html>")
+
+    def _header(self, doc):
+        return _xpath(doc, f"//span[{_cls('library-header-image')}]//img/@src")[0].replace(
+            "avatar70s", "avatar300s"
+        )
+
+    def _chartlist(self, container, convert):
+        items = []
+        for row in _xpath(container, f".//tr[{_cls('chartlist-row')}]"):
+            name = _xpath(row, f".//td[{_cls('chartlist-name')}]//a/@title")[0]
+            playcount = _xpath(row, f".//span[{_cls('chartlist-count-bar-value')}]")[0]
+            items.append((name, convert(_text(playcount))))
+        return items
+
+    def library_overview(self, html):
+        doc = self.parse(html)
+        tbodies = _xpath(doc, "//tbody[@data-playlisting-add-entries]")
+        if len(tbodies) != 3:
+            return None
+        albumsdiv, tracksdiv, _ = tbodies
+        metadata = [None, None, None]
+        displays = _xpath(
+            doc, f"(//ul[{_cls('metadata-list')}])[1]//p[{_cls('metadata-display')}]"
+        )
+        for i, item in enumerate(displays):
+            metadata[i] = int(_text(item).replace(",", ""))
+        return {
+            "albums": self._chartlist(albumsdiv, _playcount),
+            "tracks": self._chartlist(tracksdiv, _playcount),
+            "metadata": metadata,
+            "image_url": self._header(doc),
+            "formatted_name": _text(
+                _xpath(doc, f"//h2[{_cls('library-header-title')}]")[0]
+            ).strip(),
+        }
+
+    def library_top(self, html):
+        doc = self.parse(html)
+        chartlist = _xpath(doc, "//tbody[@data-playlisting-add-entries]")
+        if not chartlist:
+            return None, []
+        artist = {
+            "image_url": self._header(doc),
+            "formatted_name": _text(
+                _xpath(doc, f"//a[{_cls('library-header-crumb')}]")[0]
+            ).strip(),
+        }
+        return artist, self._chartlist(chartlist[0], _int)
+
+    def playcount(self, html):
+        divs = _xpath(self.parse(html), f"(//*[{_cls('metadata-display')}])[1]")
+        if not divs:
+            return 0
+        return _first_int(_text(divs[0]))
+
+    def artist_image(self, html):
+        doc = self.parse(html)
+        images = _xpath(doc, f"//img[{_cls('image-list-image')}]/@src") or _xpath(
+            doc, f"//li[{_cls('image-list-item-wrapper')}]//a//img/@src"
+        )
+        return images[0].replace("/avatar170s/", "/300x300/") if images else ""
+
+    def chart_artists(self, html):
+        artists = []
+        for row in _xpath(self.parse(html), f"//tr[{_cls('chartlist-row')}]"):
+            name = _xpath(row, f".//td[{_cls('chartlist-name')}]//a/@title")[0]
+            image = _xpath(row, f"(.//td[{_cls('chartlist-image')}]//img)[1]/@src")[0]
+            artists.append((name, image.replace("/avatar70s/", "/300x300/")))
+        return artists
+
+    def similar_artists(self, html):
+        doc = self.parse(html)
+        similar = [
+            _text(_xpath(h3, "(.//a)[1]")[0])
+            for h3 in _xpath(doc, f"//h3[{_cls('artist-similar-artists-sidebar-item-name')}]")
+        ]
+        listeners = _xpath(doc, f"//li[{_cls('header-metadata-tnew-item--listeners')}]//abbr")
+        return similar, _text(listeners[0])
+
+    def lyrics_search(self, html):
+        hrefs = _xpath(self.parse(html), f"(//a[{_cls('title')}])[1]/@href")
+        return hrefs[0] if hrefs else None
+
+    def page_text(self, html):
+        # BeautifulSoup leaves script and style contents out of .text
+        doc = self.parse(html)
+        lxml.etree.strip_elements(doc, "script", "style", with_tail=False)
+        return _text(doc)
+
+
+class PlaycountStream(HTMLParser):
+    """
+    Incremental version of the playcount extractor.
+
+    Pages are fed chunk by chunk, `done` is set as soon as the first
+    metadata-display element is closed so the rest doesn't have to be read.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.done = False
+        self._tag = None
+        self._nested = 0
+        self._text = []
+
+    def feed(self, data):
+        if not self.done:
+            super().feed(data)
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            # the rest of the current chunk is still parsed
+            return
+        if self._tag is not None:
+            if tag == self._tag:
+                self._nested += 1
+            return
+        classes = (dict(attrs).get("class") or "").split()
+        if "metadata-display" in classes:
+            self._tag = tag
+
+    def handle_endtag(self, tag):
+        if tag != self._tag:
+            return
+        if self._nested:
+            self._nested -= 1
+        else:
+            self.done = True
+            self._tag = None
+
+    def handle_data(self, data):
+        if self._tag is not None:
+            self._text.append(data)
+
+    @property
+    def result(self):
+        if not self._text:
+            return 0
+        return _first_int("".join(self._text))
+
+
+BACKENDS = {"bs4": SoupExtractors}
+if "lxml" in globals():
+    BACKENDS["lxml"] = LxmlExtractors
+
+
+def get_extractors(name=None):
+    """Get the extractors for a backend, defaulting to the fastest one available."""
+    if name is None:
+        name = "lxml" if "lxml" in BACKENDS else "bs4"
+    return BACKENDS[name]()
@@ -0,0 +1,29 @@
+import aiohttp
+
+API_URL = "https://ws.audioscrobbler.com/2.0/"
+USER_AGENT = "Mozilla/5.0 (X11; Arch Linux; Linux x86_64; rv:66.0) Gecko/20100101 Firefox/66.0"
+
+# Connection pool settings for each kind of traffic. Keeping them apart means a
+# big chart downloading covers can't use up the connections api calls need.
+POOLS = {
+    # per host limit is kept in line with the api rate limiter's concurrency
+    "api": {"limit": 10, "limit_per_host": 10},
+    "scrape": {"limit": 30, "limit_per_host": 15},
+    "image": {"limit": 40, "limit_per_host": 20},
+}
+
+
+def create_session(limit, limit_per_host=0, keepalive_timeout=30, dns_cache_ttl=300, timeout=30):
+    """Create a client session with a tuned, keep-alive connection pool."""
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        use_dns_cache=True,
+        ttl_dns_cache=dns_cache_ttl,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers={"User-Agent": USER_AGENT},
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    )
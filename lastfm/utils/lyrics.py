@@ -0,0 +1,92 @@
+import base64
+import json
+import time
+import zlib
+from collections import OrderedDict
+
+
+def _store_key(query):
+    return f"lyrics={query}"
+
+
+def _pack(lyrics, title):
+    return zlib.compress(json.dumps([lyrics, title]).encode()) if lyrics else b""
+
+
+def _unpack(blob):
+    return tuple(json.loads(zlib.decompress(blob))) if blob else (None, None)
+
+
+class LyricsCache:
+    """
+    LRU cache of song lyrics, keyed by the normalized search query.
+
+    Lyrics are kept zlib compressed in memory and, once a store is attached, also
+    in the metadata store so they survive restarts. The store only holds text, so
+    the compressed blob is written there base64 encoded. Searches that found no
+    lyrics are cached too, for a shorter time.
+    """
+
+    def __init__(self, store=None, max_bytes=4 * 1024 * 1024, ttl=30 * 86400, negative_ttl=86400):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def _remember(self, key, blob, ttl):
+        self._pop(key)
+        self._entries[key] = (blob, time.monotonic() + ttl)
+        self.size += len(blob)
+        while self.size > self.max_bytes:
+            _, (old, _) = self._entries.popitem(last=False)
+            self.size -= len(old)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    async def get(self, query):
+        """Get (lyrics, title) for a query, (None, None) if it has no lyrics or None on a miss."""
+        key = query.lower()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] < time.monotonic():
+            self._pop(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _unpack(entry[0])
+        if self.store is not None:
+            stored = await self.store.get(_store_key(key))
+            if stored is not None:
+                blob = base64.b64decode(stored[0])
+                self._remember(key, blob, self.ttl if blob else self.negative_ttl)
+                self.hits += 1
+                return _unpack(blob)
+        self.misses += 1
+        return None
+
+    async def set(self, query, lyrics, title):
+        key = query.lower()
+        ttl = self.ttl if lyrics else self.negative_ttl
+        blob = _pack(lyrics, title)
+        self._remember(key, blob, ttl)
+        if self.store is not None:
+            await self.store.set(_store_key(key), base64.b64encode(blob).decode(), ttl)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import make_key
+
+# Slowly changing entity metadata that is worth keeping across restarts.
+# Only requests without a user are stored, user play counts change too often.
+PERSISTENT_TTLS = {
+    "artist.getinfo": 7 * 86400,
+    "album.getinfo": 7 * 86400,
+    "track.getinfo": 7 * 86400,
+}
+
+
+def store_key(params):
+    """Key for a request if its response belongs in the store, otherwise None."""
+    method = str(params.get("method", "")).lower()
+    if method not in PERSISTENT_TTLS or "user" in params or "username" in params:
+        return None
+    # last.fm names are case insensitive
+    return "&".join(f"{k}={str(v).lower()}" for k, v in make_key(params))
+
+
+class MetadataStore:
+    """
+    On disk cache for entity metadata, backed by sqlite.
+
+    Every query runs on a single worker thread so the event loop never blocks
+    on disk access. Expired entries are kept around as a fallback for when the
+    api is unavailable, until the size cap evicts the least recently used ones.
+    Reads don't write, access times are collected and written in batches.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, flush_interval=60, flush_size=256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._accessed = {}
+        self._flushed = time.time()
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lastfm-sqlite")
+        self._conn = None
+        self._size = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        await self._run(self._open)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+        (self._size,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._close)
+        self._executor.shutdown(wait=False)
+
+    def _close(self):
+        with contextlib.suppress(sqlite3.Error):
+            self._flush_accessed()
+            self._conn.commit()
+        self._conn.close()
+
+    async def get(self, key, stale=False):
+        """
+        Get a stored value and its size in bytes.
+
+        Returns None if there is no entry or, unless `stale` is set, it expired.
+        """
+        try:
+            entry = await self._run(self._get, key, stale)
+        except sqlite3.Error:
+            # the store is only a cache, a locked or broken database is a miss
+            entry = None
+        if not stale:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def _get(self, key, stale):
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value, expires FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (row[1] < now and not stale):
+            return None
+        self._accessed[key] = now
+        if len(self._accessed) >= self.flush_size or now - self._flushed >= self.flush_interval:
+            self._flush_accessed()
+            self._conn.commit()
+        return json.loads(row[0]), len(row[0])
+
+    def _flush_accessed(self):
+        """Write the access times collected since the last flush, without committing."""
+        self._conn.executemany(
+            "UPDATE entries SET accessed = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._accessed.items()],
+        )
+        self._accessed.clear()
+        self._flushed = time.time()
+
+    async def set(self, key, value, ttl):
+        try:
+            await self._run(self._set, key, json.dumps(value), ttl)
+        except sqlite3.Error:
+            # the store is only a cache, losing a write doesn't matter
+            pass
+
+    def _set(self, key, value, ttl):
+        self._set_many([(key, value)], ttl)
+
+    async def set_many(self, entries, ttl):
+        """Store (key, value) pairs in a single transaction."""
+        try:
+            await self._run(
+                self._set_many, [(key, json.dumps(value)) for key, value in entries], ttl
+            )
+        except sqlite3.Error:
+            # the store is only a cache, losing a write doesn't matter
+            pass
+
+    def _set_many(self, entries, ttl):
+        now = time.time()
+        for key, value in entries:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._size += len(value) - (old[0] if old else 0)
+        self._flush_accessed()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(key, value, len(value), now + ttl, now) for key, value in entries],
+        )
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        # drop least recently used entries until we are 10% under the cap
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed")
+        keys = []
+        for key, size in rows:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            keys.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+
+    async def clear(self):
+        await self._run(self._clear)
+
+    def _clear(self):
+        self._accessed.clear()
+        self._conn.execute("DELETE FROM entries")
+        self._conn.commit()
+        self._size = 0
+
+    async def stats(self):
+        (entries,) = await self._run(
+            lambda: self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        )
+        return {
+            "entries": entries,
+            "bytes": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
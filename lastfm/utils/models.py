@@ -0,0 +1,114 @@
+def _image(data):
+    """Largest image url of a last.fm image list."""
+    try:
+        return data["image"][-1]["#text"] or None
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _artist_name(artist):
+    if isinstance(artist, dict):
+        return artist.get("name") or artist.get("#text")
+    return artist
+
+
+class Artist:
+    __slots__ = ("name", "playcount", "image", "url")
+
+    def __init__(self, name, playcount=0, image=None, url=None):
+        self.name = name
+        self.playcount = playcount
+        self.image = image
+        self.url = url
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["name"], int(data.get("playcount", 0)), _image(data), data.get("url"))
+
+    def __repr__(self):
+        return f"<Artist name={self.name!r} playcount={self.playcount}>"
+
+
+class Album:
+    __slots__ = ("name", "artist", "playcount", "image", "url")
+
+    def __init__(self, name, artist, playcount=0, image=None, url=None):
+        self.name = name
+        self.artist = artist
+        self.playcount = playcount
+        self.image = image
+        self.url = url
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data["name"],
+            _artist_name(data["artist"]),
+            int(data.get("playcount", 0)),
+            _image(data),
+            data.get("url"),
+        )
+
+    def __repr__(self):
+        return f"<Album name={self.name!r} artist={self.artist!r} playcount={self.playcount}>"
+
+
+class Track:
+    __slots__ = ("name", "artist", "playcount", "image", "url")
+
+    def __init__(self, name, artist, playcount=0, image=None, url=None):
+        self.name = name
+        self.artist = artist
+        self.playcount = playcount
+        self.image = image
+        self.url = url
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data["name"],
+            _artist_name(data["artist"]),
+            int(data.get("playcount", 0)),
+            _image(data),
+            data.get("url"),
+        )
+
+    def __repr__(self):
+        return f"<Track name={self.name!r} artist={self.artist!r} playcount={self.playcount}>"
+
+
+class Scrobble:
+    """A single entry of user.getrecenttracks."""
+
+    __slots__ = ("name", "artist", "album", "image", "url", "timestamp", "nowplaying")
+
+    def __init__(
+        self, name, artist, album=None, image=None, url=None, timestamp=None, nowplaying=False
+    ):
+        self.name = name
+        self.artist = artist
+        self.album = album
+        self.image = image
+        self.url = url
+        self.timestamp = timestamp
+        self.nowplaying = nowplaying
+
+    @classmethod
+    def from_json(cls, data):
+        nowplaying = bool(data.get("@attr", {}).get("nowplaying"))
+        date = data.get("date")
+        return cls(
+            data["name"],
+            _artist_name(data["artist"]),
+            data.get("album", {}).get("#text") or None,
+            _image(data),
+            data.get("url"),
+            int(date["uts"]) if date else None,
+            nowplaying,
+        )
+
+    def __repr__(self):
+        return f"<Scrobble name={self.name!r} artist={self.artist!r} timestamp={self.timestamp}>"
+
+
+MODELS = {"artist": Artist, "album": Album, "track": Track}
@@ -0,0 +1,34 @@
+from .extract import get_extractors
+from .workerpool import WorkerPool
+
+_extractors = {}
+
+
+def _parse(backend, method, html):
+    """Run an extractor in a worker."""
+    extractors = _extractors.get(backend)
+    if extractors is None:
+        extractors = _extractors[backend] = get_extractors(backend)
+    return getattr(extractors, method)(html)
+
+
+class ParsePool(WorkerPool):
+    """
+    Runs html extractors off the event loop.
+
+    Pages are handed to a pool of worker threads or processes and the extracted
+    records are awaited.
+    """
+
+    thread_name_prefix = "lastfm-parse"
+
+    def __init__(self, mode="thread", workers=2, backend=None):
+        self.backend = get_extractors(backend).name
+        super().__init__(mode, workers)
+
+    async def extract(self, method, html):
+        """Run the extractor `method` on a page in the pool."""
+        return await self.run(_parse, self.backend, method, html)
+
+    def stats(self):
+        return dict(super().stats(), backend=self.backend)
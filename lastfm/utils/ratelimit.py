@@ -0,0 +1,104 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import time
+
+# Priority lanes, lower values are served first.
+INTERACTIVE = 0
+BULK = 1
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter combined with a cap on in-flight requests.
+
+    Waiters are served by priority lane first and arrival order second, so a
+    single user command queued behind a server wide fan-out goes out next.
+    """
+
+    def __init__(self, rate=5.0, max_concurrency=10, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.max_concurrency = max_concurrency
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._active = 0
+        self._waiters = []
+        self._counter = itertools.count()
+        self._timer = None
+
+    def configure(self, rate=None, max_concurrency=None):
+        if rate is not None:
+            self.rate = rate
+            self.burst = max(rate, 1)
+            self._tokens = min(self._tokens, self.burst)
+        if max_concurrency is not None:
+            self.max_concurrency = max_concurrency
+        self._dispatch()
+
+    @property
+    def queued(self):
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    @property
+    def active(self):
+        return self._active
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, priority=INTERACTIVE):
+        await self._wait(priority)
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._dispatch()
+
+    async def _wait(self, priority):
+        self._refill()
+        if not self._waiters and self._can_start():
+            self._start()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # we were handed a slot right as we got cancelled, give it back
+                self._active -= 1
+                self._dispatch()
+            raise
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _can_start(self):
+        return self._active < self.max_concurrency and self._tokens >= 1
+
+    def _start(self):
+        self._active += 1
+        self._tokens -= 1
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._active >= self.max_concurrency:
+                # a finishing request will dispatch again
+                return
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            self._start()
+            future.set_result(None)
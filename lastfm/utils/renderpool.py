@@ -0,0 +1,47 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+from ..exceptions import *
+from .workerpool import WorkerPool
+
+
+class RenderPool(WorkerPool):
+    """
+    Renders charts in a pool of worker threads, or processes, off the event loop.
+
+    Jobs are module level functions taking and returning plain bytes. In process
+    mode they are sent the encoded covers rather than decoded tiles, so only a few
+    MB cross the process boundary. Up to `max_queued` jobs wait for a free worker,
+    more are turned away instead of piling up, and a job that takes longer than
+    `timeout` seconds is given up on.
+    """
+
+    thread_name_prefix = "lastfm-render"
+
+    def __init__(self, mode="thread", workers=2, max_queued=8, timeout=60):
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.rejected = 0
+        self.timeouts = 0
+        super().__init__(mode, workers)
+
+    async def render(self, func, *args):
+        """Run `func(*args)` in the pool and return its result."""
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise ChartRenderError(
+                "Too many charts are being made right now, please try again in a bit."
+            )
+        try:
+            return await self.run(func, *args, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            # a fresh pool for the next jobs, a stuck process worker is killed
+            self._restart(terminate=True)
+            raise ChartRenderError("Making the chart took too long, try a smaller size.")
+        except BrokenProcessPool:
+            # its worker was killed along with one that timed out
+            raise ChartRenderError("Making the chart failed, please try again.")
+
+    def stats(self):
+        return dict(super().stats(), rejected=self.rejected, timeouts=self.timeouts)
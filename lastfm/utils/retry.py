@@ -0,0 +1,95 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+# https://www.last.fm/api/errorcodes
+# 8: operation failed, 11: service offline, 16: temporary error, 29: rate limit exceeded
+RETRYABLE_ERROR_CODES = {8, 11, 16, 29}
+RETRYABLE_STATUSES = {500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for idempotent requests."""
+
+    def __init__(self, attempts=3, base=0.5, cap=8.0):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.retries = 0
+
+    def delay(self, attempt, error_code=None):
+        base = self.base
+        if error_code == 29:
+            # back off harder when we are the reason for the errors
+            base *= 4
+        # "full jitter", spreads the retries of a fan-out instead of syncing them up
+        return random.uniform(0, min(self.cap, base * 2**attempt))
+
+    async def sleep(self, attempt, error_code=None):
+        self.retries += 1
+        await asyncio.sleep(self.delay(attempt, error_code))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests for `reset_timeout` seconds after `threshold`
+    consecutive failures. Once the timeout passes a single probe request is let
+    through, closing the circuit again if it succeeds.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+        self._open_time = 0.0
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    @property
+    def open_time(self):
+        """Total seconds the circuit has spent open."""
+        if self.opened_at is None:
+            return self._open_time
+        return self._open_time + time.monotonic() - self.opened_at
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self._probing = True
+        return True
+
+    def release_probe(self):
+        """Let another probe through if this one ended without a reply."""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        if self.opened_at is not None:
+            self._open_time += time.monotonic() - self.opened_at
+            self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing:
+            self._probing = False
+            now = time.monotonic()
+            self._open_time += now - self.opened_at
+            self.opened_at = now
+        elif self.opened_at is None and self.failures >= self.threshold:
+            self.trips += 1
+            self.opened_at = time.monotonic()
@@ -4,53 +4,72 @@ import re
 import urllib
 from typing import Tuple
 
-from bs4 import BeautifulSoup
+from .extract import PlaycountStream, lyrics_from_text
+from .http import USER_AGENT
+
+# Seconds a user's scraped library pages of an artist are reused for.
+LIBRARY_TTL = 300
 
 
 class ScrapingMixin:
     async def artist_top(self, ctx, period, artistname, datatype, name):
         """Scrape either top tracks or top albums from lastfm library page."""
-        if not self.login_token:
-            return None, []
-        url = (
-            f"https://last.fm/user/{name}/library/music/{artistname}/"
-            f"+{datatype}?date_preset={self.period_http_format(period)}"
+        library = await self.library_artist(ctx, name, artistname, period)
+        return library[datatype]
+
+    async def library_artist(self, ctx, username, artistname, period):
+        """
+        A user's library overview, top tracks and top albums of an artist, and its info.
+
+        Everything is requested at once and cached together for a few minutes, so
+        `fm artist` subcommands run after each other share the same pages.
+        """
+        key = (username.lower(), artistname.lower(), period)
+        library = self.library_cache.get(key)
+        if library is not None:
+            return library
+        return await self._library_requests.run(
+            key, lambda: self._fetch_library_artist(ctx, key, username, artistname, period)
         )
-        data = await self.fetch(ctx, url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
-        data = []
-        try:
-            chartlist = soup.find("tbody", {"data-playlisting-add-entries": ""})
-        except ValueError:
-            return None, []
-
-        artist = {
-            "image_url": soup.find("span", {"class": "library-header-image"})
-            .find("img")
-            .get("src")
-            .replace("avatar70s", "avatar300s"),
-            "formatted_name": soup.find("a", {"class": "library-header-crumb"}).text.strip(),
-        }
-
-        items = chartlist.findAll("tr", {"class": "chartlist-row"})
-        for item in items:
-            name = item.find("td", {"class": "chartlist-name"}).find("a").get("title")
-            playcount = (
-                item.find("span", {"class": "chartlist-count-bar-value"})
-                .text.replace("scrobbles", "")
-                .replace("scrobble", "")
-                .strip()
-            )
-            data.append((name, int(playcount.replace(",", ""))))
 
-        return artist, data
+    async def _fetch_library_artist(self, ctx, key, username, artistname, period):
+        url = f"https://last.fm/user/{username}/library/music/{artistname}"
+        query = {"date_preset": self.period_http_format(period)}
+        requests = [
+            self.api_request(
+                ctx, {"method": "artist.getInfo", "artist": artistname}, supress_errors=True
+            ),
+            self._scrape_page(ctx, url, query, "library_overview"),
+        ]
+        if self.login_token:
+            requests.append(self._scrape_page(ctx, f"{url}/+tracks", query, "library_top"))
+            requests.append(self._scrape_page(ctx, f"{url}/+albums", query, "library_top"))
+        info, overview, *top = await asyncio.gather(*requests)
+        tracks, albums = top or ((None, []), (None, []))
+        library = {"info": info, "overview": overview, "tracks": tracks, "albums": albums}
+        self.library_cache.set(key, library, len(repr(library)), LIBRARY_TTL)
+        return library
+
+    async def _scrape_page(self, ctx, url, params, extractor):
+        data = await self.fetch(ctx, url, params, handling="text")
+        return await self.parse_pool.extract(extractor, data)
 
     async def lyrics_musixmatch(self, artistsong) -> Tuple[str, str]:
         artistsong = re.sub("[^a-zA-Z0-9 \n.]", "", artistsong)
         artistsong = re.sub(r"\s+", " ", artistsong).strip()
-        headers = {
-            "User-Agent": "Mozilla/5.0 (X11; Arch Linux; Linux x86_64; rv:66.0) Gecko/20100101 Firefox/66.0"
-        }
+        cached = await self.lyrics_cache.get(artistsong)
+        if cached is not None:
+            return cached
+        lyrics = await self.scrape_lyrics(artistsong)
+        if lyrics is None:
+            # musixmatch refused the search, that says nothing about the song
+            return None, None
+        await self.lyrics_cache.set(artistsong, *lyrics)
+        return lyrics
+
+    async def scrape_lyrics(self, artistsong):
+        """Lyrics and title of a song, (None, None) if it has none or None if the search failed."""
+        headers = {"User-Agent": USER_AGENT}
         async with self.session.get(
             "https://musixmatch.com/search/{}".format(artistsong).replace(" ", "%20"),
             headers=headers,
@@ -58,45 +77,29 @@ class ScrapingMixin:
             if resp.status == 200:
                 result = await resp.text()
             else:
-                return None, None
-        soup = BeautifulSoup(result, "html.parser")
-        songurl = soup.find("a", {"class": "title"})
+                return None
+        songurl = await self.parse_pool.extract("lyrics_search", result)
         if songurl is None:
             return None, None
-        url = "https://www.musixmatch.com" + songurl["href"]
+        url = "https://www.musixmatch.com" + songurl
         async with self.session.get(url, headers=headers) as resp:
-            result = await resp.text()
-        soup = BeautifulSoup(result, "html.parser")
-        lyrics = soup.text.split('"body":"')
-        lyrics = lyrics[0]
-        songname = lyrics.split("|")[0]
-        lyrics = lyrics.split('","language"')[0]
-        try:
-            lyrics = lyrics.split("languages")[1]
-        except IndexError:
-            return None, None
-        lyrics = lyrics.split("Report")[0]
-        lyrics = lyrics.replace("\\n", "\n")
-        lyrics = lyrics.replace("\\", "")
-        lyrics = lyrics.replace("&amp;", "&")
-        lyrics = lyrics.replace("`", "'")
-        lyrics = lyrics.strip()
-        return lyrics, songname.strip()
+            if resp.status == 200:
+                result = await resp.text()
+            else:
+                # a captcha or error page, not a song without lyrics
+                return None
+        text = await self.parse_pool.extract("page_text", result)
+        return lyrics_from_text(text)
 
     async def scrape_artist_image(self, artist, ctx):
+        return await self.artist_images.lookup(
+            artist, lambda name: self._scrape_artist_image(name, ctx)
+        )
+
+    async def _scrape_artist_image(self, artist, ctx):
         url = f"https://www.last.fm/music/{urllib.parse.quote_plus(artist)}/+images"
         data = await self.fetch(ctx, url, handling="text")
-
-        soup = BeautifulSoup(data, "html.parser")
-        if soup is None:
-            return ""
-        image = soup.find("img", {"class": "image-list-image"})
-        if image is None:
-            try:
-                image = soup.find("li", {"class": "image-list-item-wrapper"}).find("a").find("img")
-            except AttributeError:
-                return ""
-        return image["src"].replace("/avatar170s/", "/300x300/") if image else ""
+        return await self.parse_pool.extract("artist_image", data)
 
     async def scrape_artists_for_chart(self, ctx, username, period, amount):
         period_format_map = {
@@ -116,69 +119,39 @@ class ScrapingMixin:
 
         responses = await asyncio.gather(*tasks)
 
-        images = []
+        artists = []
         for data in responses:
-            if len(images) >= amount:
+            if len(artists) >= amount:
                 break
             else:
-                soup = BeautifulSoup(data, "html.parser")
-                imagedivs = soup.findAll("td", {"class": "chartlist-image"})
-                images += [
-                    div.find("img")["src"].replace("/avatar70s/", "/300x300/") for div in imagedivs
-                ]
+                artists += await self.parse_pool.extract("chart_artists", data)
 
-        return images
+        # later artist image lookups of these artists won't need to scrape
+        asyncio.ensure_future(self.artist_images.update(artists))
+        return [image for _, image in artists]
 
     async def get_similar_artists(self, artistname, ctx):
-        similar = []
         url = f"https://last.fm/music/{artistname}"
         data = await self.fetch(ctx, url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
-        for artist in soup.findAll("h3", {"class": "artist-similar-artists-sidebar-item-name"}):
-            similar.append(artist.find("a").text)
-        listeners = (
-            soup.find("li", {"class": "header-metadata-tnew-item--listeners"}).find("abbr").text
-        )
-        return similar, listeners
+        return await self.parse_pool.extract("similar_artists", data)
 
     async def get_playcount_scraper(self, ctx, username, artistname, period):
         url = (
             f"https://last.fm/user/{username}/library/music/{artistname}"
             f"?date_preset={self.period_http_format(period)}"
         )
-        data = await self.fetch(ctx, url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
-        divs = soup.findAll(class_="metadata-display")
-        if not divs:
-            return 0
-        div = divs[0]
-        plays = div.get_text()
-        return int(plays.split(" ")[0].replace(",", ""))
+        return await self.fetch_until(ctx, url, PlaycountStream)
 
     async def get_playcount_track_scraper(self, ctx, username, artistname, trackname, period):
         url = (
             f"https://last.fm/user/{username}/library/music/{artistname}/_/{trackname}"
             f"?date_preset={self.period_http_format(period)}"
         )
-        data = await self.fetch(ctx, url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
-        divs = soup.findAll(class_="metadata-display")
-        if not divs:
-            return 0
-        div = divs[0]
-        plays = div.get_text()
-        return int(plays.split(" ")[0].replace(",", ""))
+        return await self.fetch_until(ctx, url, PlaycountStream)
 
     async def get_playcount_album_scraper(self, ctx, username, artistname, albumname, period):
         url = (
             f"https://last.fm/user/{username}/library/music/{artistname}/{albumname}"
             f"?date_preset={self.period_http_format(period)}"
         )
-        data = await self.fetch(ctx, url, handling="text")
-        soup = BeautifulSoup(data, "html.parser")
-        divs = soup.findAll(class_="metadata-display")
-        if not divs:
-            return 0
-        div = divs[0]
-        plays = div.get_text()
-        return int(plays.split(" ")[0].replace(",", ""))
+        return await self.fetch_until(ctx, url, PlaycountStream)
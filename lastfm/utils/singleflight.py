@@ -0,0 +1,37 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Runs one task per key for concurrent callers asking for the same thing.
+
+    The first call for a key starts the work, later calls made while it runs wait
+    on the same task. Each caller waits on a shield, so a cancelled caller doesn't
+    cancel the work the others are still waiting on.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def start(self, key, func):
+        """Get the running task for `key`, starting `func()` if there is none."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    async def run(self, key, func):
+        """Await the result of the task for `key`, see start."""
+        return await asyncio.shield(self.start(key, func))
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # mark the exception as retrieved in case every waiter was cancelled
+            task.exception()
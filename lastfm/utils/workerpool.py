@@ -0,0 +1,129 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+MODES = ("thread", "process")
+
+# Red imports cogs under names a fresh interpreter can't import again, forked
+# workers inherit the already imported modules instead. Forking a process with
+# threads running can leave a worker stuck on a lock copied in its locked state,
+# which is why process workers have to be opted into.
+CAN_FORK = "fork" in multiprocessing.get_all_start_methods()
+
+
+def check_mode(mode):
+    """Why `mode` can't be used for a worker pool, None if it can."""
+    if mode not in MODES:
+        return f"Mode must be one of {', '.join(MODES)}."
+    if mode == "process" and not CAN_FORK:
+        return "Process workers need fork, which isn't available on this platform."
+    return None
+
+
+def _timed(func, args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class WorkerPool:
+    """
+    Runs cpu heavy jobs off the event loop, on worker threads or forked processes.
+
+    Jobs are module level functions so they can be sent to a process. At most
+    `workers * 4` jobs are handed to the executor at once, the rest wait on the
+    event loop so a burst can't pile up its arguments inside the executor.
+    """
+
+    thread_name_prefix = "lastfm-worker"
+
+    def __init__(self, mode="thread", workers=2):
+        self.mode = None
+        self.workers = 0
+        self._executor = None
+        self._slots = None
+        self.pending = 0
+        self.done = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.configure(mode, workers)
+
+    def configure(self, mode, workers):
+        error = check_mode(mode)
+        if error is not None:
+            raise ValueError(error)
+        if (mode, workers) == (self.mode, self.workers):
+            return
+        self.mode = mode
+        self.workers = workers
+        self._slots = asyncio.Semaphore(workers * 4)
+        self._restart()
+
+    def _restart(self, terminate=False):
+        """
+        Swap in a fresh executor. Jobs already submitted still finish on the old
+        one, unless `terminate` is set, which kills the old process workers.
+        """
+        old = self._executor
+        if self.mode == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("fork")
+            )
+        else:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix=self.thread_name_prefix
+            )
+        if old is None:
+            return
+        # threads can't be stopped, a stuck process can
+        processes = []
+        if terminate and isinstance(old, ProcessPoolExecutor):
+            processes = list((old._processes or {}).values())
+        old.shutdown(wait=False)
+        for process in processes:
+            process.terminate()
+
+    @property
+    def active(self):
+        return min(self.pending, self.workers)
+
+    @property
+    def queued(self):
+        return max(self.pending - self.workers, 0)
+
+    async def run(self, func, *args, timeout=None):
+        """Run `func(*args)` on a worker and return its result."""
+        self.pending += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self._executor, _timed, func, args)
+                result, elapsed = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.done += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "active": self.active,
+            "queued": self.queued,
+            "done": self.done,
+            "errors": self.errors,
+            "avg_time": self.total_time / self.done if self.done else 0.0,
+            "max_time": self.max_time,
+        }